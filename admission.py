@@ -0,0 +1,177 @@
+"""
+媒体准入检查
+详情返回后、任何下载或渲染开始前统一判断一次：时长是否超限，以及每个媒体链接的大小与类型
+（Range 0-0 / HEAD 探测）。HTML/JSON 错误页和超过大小上限的文件在这里就被拒绝，
+被拒绝的视频依次探测码率阶梯中更低的码率，找到可用的即改用它；
+后续的卡片、下载、发送阶段直接使用这里的结论，不再各自判断
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+# 媒体链接返回这些类型时，说明拿到的是错误页/风控页而不是文件
+ERROR_PAGE_TYPES = ("text/html", "application/json", "text/plain", "text/xml", "application/xml")
+
+
+class MediaProbe:
+    """单个媒体链接的探测结果"""
+
+    def __init__(
+        self,
+        url: str,
+        kind: str,
+        status: Optional[int] = None,
+        size: Optional[int] = None,
+        content_type: Optional[str] = None,
+    ):
+        self.url = url
+        self.kind = kind
+        self.status = status
+        self.size = size
+        self.content_type = (content_type or "").split(";")[0].strip().lower() or None
+
+    @property
+    def known(self) -> bool:
+        """探测是否拿到了有效响应（失败时不做判断，交给下载阶段）"""
+        return self.status in (200, 206)
+
+
+class AdmissionResult:
+    """准入结论：整条帖子是否放行，以及每个媒体链接的探测结果与拒绝原因"""
+
+    def __init__(self, reason: Optional[str] = None):
+        self.reason = reason  # 整条帖子的媒体被拒绝的原因（如时长超限）
+        self.probes: Dict[str, MediaProbe] = {}
+        self.rejected: Dict[str, str] = {}
+        self.substitutes: Dict[str, str] = {}  # 被拒绝的视频 → 通过探测的低码率链接
+
+    @property
+    def accepted(self) -> bool:
+        return self.reason is None
+
+    def allows(self, url: str) -> bool:
+        return self.accepted and url not in self.rejected
+
+    def size_of(self, url: str) -> Optional[int]:
+        probe = self.probes.get(url)
+        return probe.size if probe else None
+
+    def summary(self) -> str:
+        if self.reason:
+            return f"rejected: {self.reason}"
+        known = [p.size for p in self.probes.values() if p.size]
+        return (
+            f"probed {len(self.probes)}, rejected {len(self.rejected)}, "
+            f"stepped down {len(self.substitutes)}, "
+            f"known size {sum(known) / 1024 / 1024:.1f}MB"
+        )
+
+
+class MediaAdmission:
+    """在下载开始前对帖子媒体做准入检查"""
+
+    def __init__(
+        self,
+        max_size: int,
+        max_duration: int,
+        concurrency: int = 6,
+        probe_timeout: float = 5,
+    ):
+        """
+        Args:
+            max_size: 单个文件大小上限（字节），0 表示不限制
+            max_duration: 视频时长上限（秒），0 表示不限制
+            concurrency: 同时进行的探测请求数
+            probe_timeout: 单个探测请求的超时（秒）
+        """
+        self.max_size = max_size
+        self.max_duration = max_duration
+        self.concurrency = max(1, concurrency)
+        self.probe_timeout = probe_timeout
+
+    async def check(
+        self,
+        result: Dict[str, Any],
+        images: List[str],
+        video_links: List[str],
+        probe: Callable[[str, float], Awaitable[Dict[str, Any]]],
+        fallbacks: Optional[Dict[str, List[str]]] = None,
+    ) -> AdmissionResult:
+        """
+        Args:
+            result: Extractor.extract_data 的结果
+            images: 待发送的图片链接
+            video_links: 待发送的视频链接
+            probe: 探测函数 (url, timeout) -> {"status", "size", "content_type"}
+            fallbacks: 视频链接 → 按画质降序的更低码率链接，所选码率被拒绝时依次探测
+        """
+        duration_seconds = result.get("duration_seconds", 0) or 0
+        if self.max_duration and duration_seconds > self.max_duration:
+            metrics.incr("admission.duration_rejected")
+            return AdmissionResult(
+                f"Video duration {duration_seconds / 60:.1f} min exceeds limit "
+                f"{self.max_duration / 60:.1f} min. Skip video download."
+            )
+
+        admission = AdmissionResult()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(url: str, kind: str) -> MediaProbe:
+            async with semaphore:
+                try:
+                    info = await probe(url, self.probe_timeout)
+                except Exception as e:
+                    logger.debug(f"[admission] 探测失败 {url}: {e}")
+                    info = {}
+            admission.probes[url] = MediaProbe(
+                url, kind, info.get("status"), info.get("size"), info.get("content_type")
+            )
+            return admission.probes[url]
+
+        targets = [(u, "image") for u in images] + [(u, "video") for u in video_links]
+        # 同一链接只探测一次
+        unique = {url: kind for url, kind in targets}
+        await asyncio.gather(*(run(url, kind) for url, kind in unique.items()))
+
+        for url, probe_result in admission.probes.items():
+            reason = self._judge(probe_result)
+            if reason:
+                admission.rejected[url] = reason
+                metrics.incr("admission.asset_rejected")
+                logger.warning(f"[admission] 拒绝 {probe_result.kind}: {reason} ({url})")
+
+        async def step_down(url: str, rung_urls: List[str]):
+            for rung_url in rung_urls:
+                reason = self._judge(await run(rung_url, "video"))
+                if reason is None:
+                    admission.substitutes[url] = rung_url
+                    metrics.incr("admission.rung_fallback")
+                    logger.info(f"[admission] 改用更低码率: {rung_url}")
+                    return
+                admission.rejected[rung_url] = reason
+
+        await asyncio.gather(*(
+            step_down(url, rung_urls)
+            for url, rung_urls in (fallbacks or {}).items()
+            if url in admission.rejected and rung_urls
+        ))
+        return admission
+
+    def _judge(self, probe: MediaProbe) -> Optional[str]:
+        if not probe.known:
+            return None
+        if probe.content_type and probe.content_type.startswith(ERROR_PAGE_TYPES):
+            return f"unexpected content type {probe.content_type}"
+        if probe.size and self.max_size and probe.size > self.max_size:
+            return (
+                f"size {probe.size / 1024 / 1024:.1f}MB exceeds limit "
+                f"{self.max_size / 1024 / 1024:.0f}MB"
+            )
+        return None
@@ -6,13 +6,13 @@
 import re
 import os
 import json
-import random
-import string
+import time
 import asyncio
 import base64
 import traceback
-from typing import Optional, Dict
-from urllib.parse import urlparse
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlparse, urljoin
 
 import aiohttp
 from aiohttp import CookieJar
@@ -21,8 +21,22 @@ from astrbot.api import logger
 # 从同步版本导入 ABogus 和 Extractor
 try:
     from .dysk import ABogus, Extractor, USERAGENT
+    from .token_store import DouyinTokenStore, DouyinIdentity, TTWID_REGISTER_PAYLOAD, generate_ms_token
+    from .http_pool import HttpPool
+    from .detail_cache import DetailCache
+    from .link_cache import ShortLinkCache
+    from .url_classifier import classify_douyin_url, extract_aweme_id
+    from .metrics import metrics
+    from .singleflight import SingleFlight
 except ImportError:
     from dysk import ABogus, Extractor, USERAGENT
+    from token_store import DouyinTokenStore, DouyinIdentity, TTWID_REGISTER_PAYLOAD, generate_ms_token
+    from http_pool import HttpPool
+    from detail_cache import DetailCache
+    from link_cache import ShortLinkCache
+    from url_classifier import classify_douyin_url, extract_aweme_id
+    from metrics import metrics
+    from singleflight import SingleFlight
 
 
 class AsyncDouyinDownloader:
@@ -36,10 +50,15 @@ class AsyncDouyinDownloader:
         download_timeout=280,
         common_timeout=15,
         max_size=None,
-        max_duration=None
+        max_duration=None,
+        token_store: Optional[DouyinTokenStore] = None,
+        http_pool: Optional[HttpPool] = None,
+        detail_cache: Optional[DetailCache] = None,
+        link_cache: Optional[ShortLinkCache] = None,
+        singleflight: Optional[SingleFlight] = None
     ):
         self.ab = ABogus(USERAGENT)
-        self.extractor = Extractor()
+        self.extractor = Extractor(max_size=max_size)
         self.enable_cf_proxy = enable_cf_proxy
         self.cf_proxy_url = cf_proxy_url.rstrip("/") if cf_proxy_url else ""
 
@@ -49,6 +68,13 @@ class AsyncDouyinDownloader:
         self.common_timeout = common_timeout
         self.max_size = max_size  # 字节
         self.max_duration = max_duration  # 秒
+        self.max_redirect_hops = 5  # 短链接最多跟随的重定向跳数
+        self.token_store = token_store  # 共享身份池，为空时每次现场获取
+        self._identity: Optional[DouyinIdentity] = None  # 本次租用的身份
+        self.http_pool = http_pool  # 共享连接池，为空时使用独立连接器
+        self.detail_cache = detail_cache  # 按 aweme_id 的详情缓存
+        self.link_cache = link_cache  # 短链接 → aweme_id 持久化缓存
+        self.singleflight = singleflight  # 同一 aweme_id 的并发请求合并
 
         # ========== Cookie 管理（关键修复）==========
         # 使用 aiohttp 的 CookieJar 来自动管理 cookies
@@ -58,46 +84,76 @@ class AsyncDouyinDownloader:
         # Session 延迟创建
         self._session: Optional[aiohttp.ClientSession] = None
         self._initialized = False
+        # 在本实例 session 上执行、可能被其他请求等待的合并请求
+        self._flights: Set[asyncio.Task] = set()
+
+        # 最近一次 get_detail 各阶段耗时（毫秒）
+        self.stage_timings: Dict[str, float] = {}
 
     async def _get_session(self) -> aiohttp.ClientSession:
         """获取或创建 session - 使用 CookieJar 自动管理 cookies"""
         if self._session is None or self._session.closed:
             timeout = aiohttp.ClientTimeout(total=30)
             # 创建session时传入cookie_jar，让aiohttp自动管理cookies
-            self._session = aiohttp.ClientSession(
-                timeout=timeout,
-                cookie_jar=self._cookie_jar
-            )
+            if self.http_pool is not None:
+                # 复用共享连接器（DNS/TCP/TLS），CookieJar 仍然按请求隔离
+                self._session = self.http_pool.session(
+                    cookie_jar=self._cookie_jar,
+                    timeout=timeout
+                )
+            else:
+                self._session = aiohttp.ClientSession(
+                    timeout=timeout,
+                    cookie_jar=self._cookie_jar
+                )
         return self._session
 
     async def close(self):
-        """关闭 session"""
+        """关闭 session（共享连接器保持不变）并归还租用的身份
+
+        仍有合并请求在使用本 session 时（其他解析在等待它的结果），推迟到这些请求结束后再关闭
+        """
+        flights = [t for t in self._flights if not t.done()]
+        if flights:
+            task = asyncio.ensure_future(self._close_after(flights))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            return
+        await self._close_now()
+
+    async def _close_after(self, flights: List[asyncio.Task]):
+        await asyncio.gather(*flights, return_exceptions=True)
+        await self._close_now()
+
+    async def _close_now(self):
         if self._session and not self._session.closed:
             await self._session.close()
+        if self.token_store is not None and self._identity is not None:
+            self.token_store.release(self._identity)
+            self._identity = None
 
     async def _init_tokens(self):
         """初始化 tokens（msToken 和 ttwid）"""
         if self._initialized:
             return
 
+        # 优先从共享身份池租用，省去 ttwid 注册请求
+        if self.token_store is not None:
+            try:
+                self._apply_identity(await self.token_store.acquire())
+                self._initialized = True
+                return
+            except Exception as e:
+                logger.warning(f"共享身份获取失败，回退到现场初始化: {e}")
+
         logger.info("正在初始化 (获取 ttwid/msToken)...")
 
         # 1. 生成 msToken
-        base_str = string.digits + string.ascii_letters
-        ms_token = "".join(random.choice(base_str) for _ in range(156))
+        ms_token = generate_ms_token()
         self._cookies["msToken"] = ms_token
         logger.debug(f"生成 msToken: {ms_token[:20]}...")
 
         # 2. 尝试获取 ttwid
-        data = {
-            "region": "cn",
-            "aid": 1768,
-            "needFid": False,
-            "service": "www.ixigua.com",
-            "migrate_info": {"ticket": "", "source": "node"},
-            "cbUrlProtocol": "https",
-            "union": True
-        }
+        data = TTWID_REGISTER_PAYLOAD
 
         session = await self._get_session()
 
@@ -119,6 +175,49 @@ class AsyncDouyinDownloader:
 
         self._initialized = True
 
+    @contextmanager
+    def _stage(self, name: str):
+        """记录一个阶段的耗时（毫秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stage_timings[name] = elapsed
+            metrics.observe(f"stage.{name}", elapsed)
+
+    @contextmanager
+    def shared(self):
+        """在其他请求也会等待其结果的任务（合并请求、共享下载）中使用本 session 时包裹，
+        close() 会推迟到这些任务结束后再关闭 session"""
+        task = asyncio.current_task()
+        self._flights.add(task)
+        try:
+            yield
+        finally:
+            self._flights.discard(task)
+
+    async def _timed(self, name: str, coro):
+        with self._stage(name):
+            return await coro
+
+    def _apply_identity(self, identity: DouyinIdentity):
+        """使用租用身份的 CookieJar 和 msToken/ttwid"""
+        self._identity = identity
+        self._cookies.update(identity.cookies())
+        if self._session is None:
+            self._cookie_jar = identity.cookie_jar
+        else:
+            # session 已创建，只能把身份 cookies 复制进当前 CookieJar
+            for morsel in identity.cookie_jar:
+                self._cookie_jar.update_cookies({morsel.key: morsel})
+        logger.debug(f"使用共享身份: msToken={identity.ms_token[:20]}...")
+
+    def _report_identity(self, ok: bool):
+        """向身份池上报详情请求结果，用于隔离被风控的身份"""
+        if self.token_store is not None and self._identity is not None:
+            self.token_store.report(self._identity, ok)
+
     def _get_cookie_string(self) -> str:
         """
         构建 Cookie 字符串
@@ -210,18 +309,25 @@ class AsyncDouyinDownloader:
         return sum(AsyncDouyinDownloader._text_mojibake_score(v) for v in fields)
 
     async def get_detail(self, url_input: str) -> Optional[dict]:
-        """获取视频详情（主入口）"""
-        try:
-            # 确保已初始化
-            await self._init_tokens()
+        """
+        获取视频详情（主入口）
 
+        阶段：[身份初始化 ∥ 短链接解析] → 详情缓存 → 并发合并 → a_bogus 签名 → 详情 API
+        身份初始化与短链接解析互不依赖，并发执行后再汇合进入签名阶段
+        """
+        self.stage_timings = {}
+        try:
             url = url_input.strip()
             if not self._is_valid_http_url(url):
                 logger.error(f"无效链接: {url_input}")
                 return None
 
-            # 1. 解析短链接获取 aweme_id
-            aweme_id = await self._resolve_short_url(url)
+            # 1. 并发：初始化 tokens + 解析短链接获取 aweme_id
+            # 重定向拿到的 cookies 写入同一个 CookieJar，CF 模式的 Cookie 头在汇合后才构建，二者都会带上
+            _, aweme_id = await asyncio.gather(
+                self._timed("tokens", self._init_tokens()),
+                self._timed("resolve", self._resolve_short_url(url)),
+            )
 
             if not aweme_id:
                 logger.error("无法解析出 aweme_id")
@@ -229,54 +335,93 @@ class AsyncDouyinDownloader:
 
             logger.info(f"解析到 ID: {aweme_id}")
 
-            # 2. 构造 API 请求参数
-            params = {
-                "device_platform": "webapp",
-                "aid": "6383",
-                "channel": "channel_pc_web",
-                "aweme_id": aweme_id,
-                "update_version_code": "170400",
-                "pc_client_type": "1",
-                "version_code": "190500",
-                "version_name": "19.5.0",
-                "cookie_enabled": "true",
-                "platform": "PC",
-                "downlink": "10",
-                "msToken": self._cookies.get("msToken", "")
-            }
-
-            # 3. 生成 a_bogus
-            params["a_bogus"] = self.ab.get_value(params)
-
-            # 4. 发送 API 请求
-            result = await self._fetch_detail_api(aweme_id, params)
-            if not result:
-                return None
-
-            # CF 详情链路如果疑似乱码，尝试直连重试并择优结果。
-            if self.enable_cf_proxy and self.cf_proxy_url:
-                cf_score = self._result_mojibake_score(result)
-                if cf_score >= 3:
-                    logger.warning(
-                        f"Detected possible mojibake in CF detail response (score={cf_score}), retrying direct API"
-                    )
-                    direct_result = await self._fetch_detail_api(
-                        aweme_id, params, force_direct=True
-                    )
-                    if direct_result:
-                        direct_score = self._result_mojibake_score(direct_result)
-                        if direct_score + 1 < cf_score:
-                            logger.info(
-                                f"Using direct API detail result to avoid mojibake (cf={cf_score}, direct={direct_score})"
-                            )
-                            return direct_result
-
-            return result
+            # 2. 命中详情缓存时跳过签名和 API 请求；临近过期的条目在后台刷新
+            if self.detail_cache is not None:
+                cached, stale = await self.detail_cache.lookup(aweme_id)
+                if cached is not None:
+                    logger.info(f"详情缓存命中: {aweme_id}{' (后台刷新)' if stale else ''}")
+                    if stale:
+                        self.detail_cache.refresh(aweme_id)
+                    return cached
+
+            # 3. 同一作品已有请求在签名/拉取详情时，直接等待它的结果
+            if self.singleflight is not None:
+                return await self.singleflight.do(
+                    f"douyin:{aweme_id}", lambda: self._fetch_shared(aweme_id)
+                )
+            return await self._fetch_and_cache(aweme_id)
 
         except Exception as e:
             logger.error(f"get_detail 异常: {e}")
             logger.error(traceback.format_exc())
             return None
+        finally:
+            if self.stage_timings:
+                logger.info(
+                    "详情阶段耗时: "
+                    + ", ".join(f"{k}={v:.0f}ms" for k, v in self.stage_timings.items())
+                )
+
+    async def _fetch_shared(self, aweme_id: str) -> Optional[dict]:
+        """作为合并请求执行：登记到本实例，close() 会等它结束后再关闭 session"""
+        with self.shared():
+            return await self._fetch_and_cache(aweme_id)
+
+    async def _fetch_and_cache(self, aweme_id: str) -> Optional[dict]:
+        result = await self.get_detail_by_id(aweme_id)
+        if result and self.detail_cache is not None:
+            await self.detail_cache.store(aweme_id, result)
+        return result
+
+    async def get_detail_by_id(self, aweme_id: str) -> Optional[dict]:
+        """按 aweme_id 签名并请求详情 API（不经过缓存）"""
+        await self._init_tokens()
+
+        # 1. 构造 API 请求参数
+        params = {
+            "device_platform": "webapp",
+            "aid": "6383",
+            "channel": "channel_pc_web",
+            "aweme_id": aweme_id,
+            "update_version_code": "170400",
+            "pc_client_type": "1",
+            "version_code": "190500",
+            "version_name": "19.5.0",
+            "cookie_enabled": "true",
+            "platform": "PC",
+            "downlink": "10",
+            "msToken": self._cookies.get("msToken", "")
+        }
+
+        # 2. 生成 a_bogus
+        with self._stage("sign"):
+            params["a_bogus"] = self.ab.get_value(params)
+
+        # 3. 发送 API 请求
+        with self._stage("fetch"):
+            result = await self._fetch_detail_api(aweme_id, params)
+        if not result:
+            return None
+
+        # CF 详情链路如果疑似乱码，尝试直连重试并择优结果。
+        if self.enable_cf_proxy and self.cf_proxy_url:
+            cf_score = self._result_mojibake_score(result)
+            if cf_score >= 3:
+                logger.warning(
+                    f"Detected possible mojibake in CF detail response (score={cf_score}), retrying direct API"
+                )
+                direct_result = await self._fetch_detail_api(
+                    aweme_id, params, force_direct=True
+                )
+                if direct_result:
+                    direct_score = self._result_mojibake_score(direct_result)
+                    if direct_score + 1 < cf_score:
+                        logger.info(
+                            f"Using direct API detail result to avoid mojibake (cf={cf_score}, direct={direct_score})"
+                        )
+                        return direct_result
+
+        return result
 
     async def _resolve_short_url(self, url: str) -> Optional[str]:
         """
@@ -289,6 +434,22 @@ class AsyncDouyinDownloader:
         if not self._is_valid_http_url(url):
             return None
 
+        # 完整链接直接在本地读出 aweme_id，只有短链接才需要网络请求
+        kind, aweme_id = classify_douyin_url(url)
+        if kind == "id":
+            logger.debug(f"本地解析到 aweme_id: {aweme_id}")
+            return aweme_id
+        if kind != "short":
+            logger.error(f"链接中不含作品 ID: {url}")
+            return None
+
+        # 短码到 aweme_id 的映射不会变化，命中缓存直接跳过重定向请求
+        short_key = ShortLinkCache.short_key(url) if self.link_cache is not None else None
+        cached_id = await self.link_cache.lookup(short_key) if short_key else None
+        if cached_id:
+            logger.debug(f"短链接缓存命中: {short_key} -> {cached_id}")
+            return cached_id
+
         session = await self._get_session()
 
         # ========== 重定向请求（Cookie 获取的关键时刻）==========
@@ -303,17 +464,13 @@ class AsyncDouyinDownloader:
             headers["Cookie"] = self._get_cookie_string()
 
         final_url = None
+        aweme_id = None
         for attempt in range(self.download_retry_times):
             try:
-                # 使用 HEAD 请求跟随重定向
-                async with session.head(
-                    url,
-                    headers=headers,
-                    allow_redirects=True
-                ) as resp:
-                    final_url = str(resp.url)
-                    # CookieJar 会自动保存响应中的 cookies
-                    break
+                # 逐跳读取 Location，出现作品 ID 即停止，不再跟随后续跳转
+                final_url, aweme_id = await self._walk_redirects(session, url, headers)
+                # CookieJar 会自动保存每一跳响应中的 cookies
+                break
             except Exception as e:
                 if attempt == self.download_retry_times - 1:
                     logger.error(f"链接解析失败(重试{self.download_retry_times}次): {e}")
@@ -337,17 +494,50 @@ class AsyncDouyinDownloader:
                 display_value = v[:50] if len(v) > 50 else v
                 logger.debug(f"Cookie manual: {k}={display_value}")
 
-        # 从 URL 中提取 aweme_id
-        pattern = re.compile(r'/(?:video|note|slides)/(\d+)')
-        match = pattern.search(final_url)
-        if match:
-            return match.group(1)
+        if aweme_id and short_key:
+            await self.link_cache.store(short_key, aweme_id)
+        return aweme_id
 
-        match = re.search(r'(?:modal_id|mid|aweme_id)=(\d+)', final_url)
-        if match:
-            return match.group(1)
+    async def _walk_redirects(
+        self, session: aiohttp.ClientSession, url: str, headers: dict
+    ):
+        """
+        手动逐跳跟随重定向，Location 中一出现 video/note/slides/modal_id 即停止
 
-        return None
+        Returns:
+            (最后到达或读到的 URL, aweme_id)
+        """
+        current = url
+        hops = 0
+        while True:
+            if hops >= self.max_redirect_hops:
+                logger.warning(f"重定向超过 {self.max_redirect_hops} 跳，停止跟随")
+                break
+            async with session.head(
+                current,
+                headers=headers,
+                allow_redirects=False
+            ) as resp:
+                hops += 1
+                location = resp.headers.get("Location")
+                if resp.status not in (301, 302, 303, 307, 308) or not location:
+                    break
+            current = urljoin(current, location)
+            aweme_id = extract_aweme_id(current)
+            if aweme_id:
+                # 不再请求该 Location 及其后续跳转
+                metrics.incr("resolve.early_stop")
+                metrics.observe("resolve.hops", hops)
+                metrics.observe("resolve.early_stop_rate", 1)
+                # 未跟随的跳数按跳数上限估算（实际落地链需要的跳数无法得知）
+                metrics.observe("resolve.hops_saved", self.max_redirect_hops - hops)
+                logger.debug(f"第 {hops} 跳即读到 aweme_id，节省后续跳转: {current}")
+                return current, aweme_id
+
+        metrics.observe("resolve.hops", hops)
+        metrics.observe("resolve.early_stop_rate", 0)
+        metrics.observe("resolve.hops_saved", 0)
+        return current, extract_aweme_id(current)
 
     async def _fetch_detail_api(
         self, aweme_id: str, params: dict, force_direct: bool = False
@@ -390,6 +580,7 @@ class AsyncDouyinDownloader:
                         text = self._decode_text_bytes(raw)
                         if not text or len(text) == 0:
                             logger.error("API 返回空响应")
+                            self._report_identity(False)
                             return None
 
                         # 尝试解析 JSON
@@ -407,13 +598,17 @@ class AsyncDouyinDownloader:
                             data = resp_json
 
                         if data.get("aweme_detail"):
+                            self._report_identity(True)
                             return self.extractor.extract_data(data["aweme_detail"])
                         else:
                             logger.error("未获取到 aweme_detail")
+                            self._report_identity(False)
                             logger.debug(f"响应数据: {json.dumps(data, ensure_ascii=False)[:200]}...")
                             return None
                     except json.JSONDecodeError as e:
+                        # 通常是验证码/风控页面
                         logger.error(f"JSON 解析失败: {e}")
+                        self._report_identity(False)
                         logger.debug(f"响应内容前200字符: {text[:200] if text else '空'}")
                         return None
                     except Exception as e:
@@ -421,6 +616,7 @@ class AsyncDouyinDownloader:
                         return None
                 else:
                     logger.error(f"API 请求失败: HTTP {resp.status}")
+                    self._report_identity(False)
                     raw = await resp.read()
                     text = self._decode_text_bytes(raw)
                     logger.debug(f"响应内容: {text[:200]}...")
@@ -429,6 +625,58 @@ class AsyncDouyinDownloader:
             logger.error(f"API 请求异常: {e}")
             return None
 
+    async def probe_media(self, url: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        探测媒体的大小与类型（不下载正文）
+
+        先发 Range: bytes=0-0 的 GET（CDN 普遍支持，Content-Range 中带总大小），
+        失败时回退为 HEAD。返回 {"status", "size", "content_type"}，取不到的字段为 None
+        """
+        info: Dict[str, Any] = {"status": None, "size": None, "content_type": None}
+        if not self._is_valid_http_url(url):
+            return info
+
+        session = await self._get_session()
+        headers = {
+            "User-Agent": USERAGENT,
+            "Accept": "*/*",
+            "Referer": "https://www.douyin.com/?recommend=1",
+            "Cookie": "dy_swidth=1536; dy_sheight=864",
+        }
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.common_timeout)
+
+        try:
+            async with session.get(
+                url, headers={**headers, "Range": "bytes=0-0"}, timeout=client_timeout
+            ) as resp:
+                info["status"] = resp.status
+                info["content_type"] = resp.headers.get("Content-Type")
+                if resp.status == 206:
+                    content_range = resp.headers.get("Content-Range", "")
+                    total = content_range.rsplit("/", 1)[-1]
+                    if total.isdigit():
+                        info["size"] = int(total)
+                    return info
+                if resp.status == 200:
+                    # 服务器忽略了 Range，不读取正文，直接关闭连接
+                    info["size"] = resp.content_length
+                    resp.close()
+                    return info
+        except Exception as e:
+            logger.debug(f"[探测] Range 请求失败，改用 HEAD: {e}")
+
+        try:
+            async with session.head(
+                url, headers=headers, timeout=client_timeout, allow_redirects=True
+            ) as resp:
+                info["status"] = resp.status
+                info["content_type"] = resp.headers.get("Content-Type") or info["content_type"]
+                if resp.status == 200:
+                    info["size"] = resp.content_length
+        except Exception as e:
+            logger.debug(f"[探测] HEAD 请求失败: {e}")
+        return info
+
     async def download_video(
         self,
         url: str,
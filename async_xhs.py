@@ -8,22 +8,45 @@ import time
 import asyncio
 import traceback
 from urllib.parse import urlparse
-from typing import Optional, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 import aiohttp
 from astrbot.api import logger
 
+try:
+    from .admission import ERROR_PAGE_TYPES
+    from .http_pool import HttpPool
+    from .link_cache import ShortLinkCache
+    from .singleflight import SingleFlight
+except ImportError:
+    from admission import ERROR_PAGE_TYPES
+    from http_pool import HttpPool
+    from link_cache import ShortLinkCache
+    from singleflight import SingleFlight
+
 
 class AsyncXiaohongshuParser:
     """异步小红书解析器"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        http_pool: Optional[HttpPool] = None,
+        link_cache: Optional[ShortLinkCache] = None,
+        singleflight: Optional[SingleFlight] = None,
+        max_size: Optional[int] = None,
+        min_resolution: int = 720,
+    ):
         # 配置常量
         self.config = {
             'timeout': 15,
             'max_retries': 3,
-            'retry_delay': 1
+            'retry_delay': 1,
+            'probe_timeout': 5,
+            'max_probes': 3
         }
+        # 视频流选择：单个文件大小上限（字节）与画质下限（短边像素）
+        self.max_size = max_size
+        self.min_resolution = min_resolution
         self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 Edg/126.0.0.0"
 
         # 正则表达式模式
@@ -54,6 +77,7 @@ class AsyncXiaohongshuParser:
                 re.compile(r'/item/([a-zA-Z0-9]+)'),
                 re.compile(r'"noteId":"([a-zA-Z0-9]+)"')
             ],
+            'note_path': re.compile(r'/(?:item|explore)/([a-zA-Z0-9]+)'),
             'og_image': [
                 re.compile(r'<meta[^>]*property=["\']og:image["\'][^>]*content=["\']([^"\']+)["\'][^>]*>', re.I),
                 re.compile(r'<meta[^>]*content=["\']([^"\']+)["\'][^>]*property=["\']og:image["\'][^>]*>', re.I),
@@ -62,14 +86,30 @@ class AsyncXiaohongshuParser:
             ]
         }
 
-        # Session 延迟创建
+        # Session 延迟创建；有共享连接池时复用插件级连接器
+        self.http_pool = http_pool
+        # xhslink 短码 → 笔记链接的持久化缓存
+        self.link_cache = link_cache
+        # 同一笔记的并发解析合并
+        self.singleflight = singleflight
         self._session: Optional[aiohttp.ClientSession] = None
 
     async def _get_session(self) -> aiohttp.ClientSession:
         """获取或创建 session"""
-        if self._session is None or self._session.closed:
+        if (
+            self._session is None
+            or self._session.closed
+            or self._session.connector is None
+            or self._session.connector.closed
+        ):
             timeout = aiohttp.ClientTimeout(total=self.config['timeout'])
-            self._session = aiohttp.ClientSession(timeout=timeout)
+            if self.http_pool is not None:
+                # 连接池空闲回收后连接器会被关闭，这里随之重建 session
+                if self._session is not None and not self._session.closed:
+                    await self._session.close()
+                self._session = self.http_pool.session(timeout=timeout)
+            else:
+                self._session = aiohttp.ClientSession(timeout=timeout)
         return self._session
 
     async def close(self):
@@ -173,17 +213,114 @@ class AsyncXiaohongshuParser:
                 break
         return images
 
-    def extract_videos(self, html):
-        video_urls = set()
+    def extract_videos(self, html, extracted_data=None):
+        """视频链接：优先使用 h264/h265 流描述中选出的流，没有流描述时按正则匹配（保持页面顺序）"""
+        video_urls = []
+        if extracted_data:
+            for video in extracted_data['livePhotoData']['videos']:
+                url = self.clean_url(video.get('url'))
+                if url and url not in video_urls:
+                    video_urls.append(url)
+            if video_urls:
+                return video_urls
+
         for pattern in self.patterns['video_url']:
             for match in pattern.finditer(html):
                 raw_url = match.group(1) if match.lastindex and match.lastindex >= 1 else match.group(0)
                 url = self.clean_url(raw_url)
                 if url and 'http' in url and ('.mp4' in url or 'xhscdn' in url):
                     # 优先选择无水印版本
-                    if '_259.mp4' not in url:
-                        video_urls.add(url)
-        return list(video_urls)
+                    if '_259.mp4' not in url and url not in video_urls:
+                        video_urls.append(url)
+        return video_urls
+
+    # ==================== 视频流选择 ====================
+
+    def parse_streams(self, parsed) -> List[Dict[str, Any]]:
+        """解析 {"h264": [...], "h265": [...]} 中的流描述"""
+        streams = []
+        for codec in ('h264', 'h265'):
+            entries = parsed.get(codec)
+            if not isinstance(entries, list):
+                continue
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    continue
+                url = self.clean_url(entry.get('masterUrl'))
+                if not self._is_valid_http_url(url):
+                    continue
+                backups = [self.clean_url(u) for u in entry.get('backupUrls') or [] if isinstance(u, str)]
+                width = self._to_int(entry.get('width'))
+                height = self._to_int(entry.get('height'))
+                streams.append({
+                    'url': url,
+                    'backupUrls': [u for u in backups if self._is_valid_http_url(u) and u != url],
+                    'codec': (entry.get('videoCodec') or codec).lower(),
+                    'size': self._to_int(entry.get('size')),
+                    'width': width,
+                    'height': height,
+                    'resolution': min(width, height) if width and height else max(width, height),
+                    'bitrate': self._to_int(entry.get('videoBitrate') or entry.get('avgBitrate')),
+                })
+        return streams
+
+    def select_stream(self, streams: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        在大小上限内选出满足画质下限的最小流，返回 (选中流, 有序备用链接)
+        没有流满足画质下限时取上限内分辨率最高的；全部超限时取最小的
+        备用链接依次为：选中流的 backupUrls，其余不超限的流（及其 backupUrls）按同样的优先级排列
+        """
+        def size_of(s):
+            return s['size'] or float('inf')
+
+        fitting = [s for s in streams if not self.max_size or not s['size'] or s['size'] <= self.max_size]
+        if not fitting:
+            return min(streams, key=size_of), []
+
+        floor = [s for s in fitting if s['resolution'] >= self.min_resolution]
+        if floor:
+            # 同样大小时优先兼容性更好的 H.264
+            ordered = sorted(floor, key=lambda s: (size_of(s), s['codec'] != 'h264'))
+            ordered += sorted(
+                (s for s in fitting if s not in floor),
+                key=lambda s: (-s['resolution'], size_of(s)),
+            )
+        else:
+            ordered = sorted(fitting, key=lambda s: (-s['resolution'], size_of(s), s['codec'] != 'h264'))
+
+        chosen = ordered[0]
+        fallbacks = []
+        for url in chosen['backupUrls'] + [u for s in ordered[1:] for u in [s['url']] + s['backupUrls']]:
+            if url != chosen['url'] and url not in fallbacks:
+                fallbacks.append(url)
+        return chosen, fallbacks
+
+    async def pick_reachable(self, candidates: List[str]) -> Optional[str]:
+        """按顺序探测候选链接（Range 0-0），返回第一个可用的；全部探测失败时返回第一个"""
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        session = await self._get_session()
+        timeout = aiohttp.ClientTimeout(total=self.config['probe_timeout'])
+        headers = {'User-Agent': self.user_agent, 'Range': 'bytes=0-0'}
+        for url in candidates[:self.config['max_probes']]:
+            try:
+                async with session.get(url, headers=headers, timeout=timeout) as resp:
+                    content_type = (resp.headers.get('Content-Type') or '').lower()
+                    if resp.status in (200, 206) and not content_type.startswith(ERROR_PAGE_TYPES):
+                        return url
+                    logger.warning(f"小红书视频流不可用 (HTTP {resp.status} {content_type})，尝试备用链接: {url}")
+            except Exception as e:
+                logger.warning(f"小红书视频流探测失败，尝试备用链接: {url}, {e}")
+        return candidates[0]
+
+    @staticmethod
+    def _to_int(value) -> int:
+        try:
+            return int(value or 0)
+        except (TypeError, ValueError):
+            return 0
 
     # ==================== 深度 JSON 分析逻辑 ====================
 
@@ -216,14 +353,15 @@ class AsyncXiaohongshuParser:
 
                         # 检查 Live 图数据
                         if 'imageScene' in parsed or 'h264' in parsed or 'h265' in parsed:
-                            if 'h264' in parsed and isinstance(parsed['h264'], list) and len(parsed['h264']) > 0:
-                                video_data = parsed['h264'][0]
-                                if 'masterUrl' in video_data:
-                                    result['livePhotoData']['videos'].append({
-                                        'url': video_data['masterUrl'],
-                                        'backupUrls': video_data.get('backupUrls', []),
-                                        'jsonIndex': 0
-                                    })
+                            streams = self.parse_streams(parsed)
+                            if streams:
+                                stream, fallbacks = self.select_stream(streams)
+                                result['livePhotoData']['videos'].append({
+                                    'url': stream['url'],
+                                    'backupUrls': fallbacks,
+                                    'stream': stream,
+                                    'jsonIndex': 0
+                                })
                             elif 'imageScene' in parsed and 'url' in parsed:
                                 if parsed['imageScene'] == 'WB_DFT':
                                     result['livePhotoData']['wbDftImages'].append({
@@ -330,14 +468,16 @@ class AsyncXiaohongshuParser:
 
     # ==================== 主流程 ====================
 
-    async def fetch_with_retry(self, url):
-        """异步请求，带重试"""
+    async def fetch_with_retry(self, url, max_retries=None):
+        """异步请求，带重试（max_retries 为空时使用配置值）"""
         if not self._is_valid_http_url(url):
             raise Exception(f"URL无效: {url}")
 
         session = await self._get_session()
+        if max_retries is None:
+            max_retries = self.config['max_retries']
 
-        for attempt in range(self.config['max_retries'] + 1):
+        for attempt in range(max_retries + 1):
             try:
                 headers = {
                     'User-Agent': self.user_agent,
@@ -357,15 +497,64 @@ class AsyncXiaohongshuParser:
                     return html, final_url
 
             except Exception as e:
-                if attempt < self.config['max_retries']:
+                if attempt < max_retries:
                     await asyncio.sleep(self.config['retry_delay'] * (attempt + 1))
                 else:
                     raise Exception(f"请求失败: {str(e)}")
 
+    async def fetch_note_page(self, url):
+        """获取笔记页面；xhslink 短链接优先使用缓存的笔记链接，省去重定向"""
+        short_key = ShortLinkCache.short_key(url) if self.link_cache is not None else None
+        cached_url = await self.link_cache.lookup(short_key) if short_key else None
+        if cached_url:
+            # 缓存的链接带有会过期的 xsec_token：只尝试一次，拿到的不是笔记页就重新解析短链接
+            try:
+                html, final_url = await self.fetch_with_retry(cached_url, max_retries=0)
+                if self.is_note_page(html):
+                    return html, final_url
+                logger.warning("短链接缓存的笔记链接返回的不是笔记页（token 过期或验证码），改用原链接")
+            except Exception as e:
+                logger.warning(f"短链接缓存的笔记链接请求失败，改用原链接: {e}")
+            await self.link_cache.discard(short_key)
+
+        html, final_url = await self.fetch_with_retry(url)
+        if (
+            short_key
+            and self.patterns['note_path'].search(urlparse(final_url).path)
+            and self.is_note_page(html)
+        ):
+            await self.link_cache.store(short_key, final_url)
+        return html, final_url
+
+    @staticmethod
+    def is_note_page(html):
+        """页面是否为正常的笔记页（带 __INITIAL_STATE__ 数据，不是错误页/验证码页）"""
+        if not html or '__INITIAL_STATE__' not in html:
+            return False
+        return not ('internal error' in html or '验证码' in html or 'captcha' in html)
+
+    def flight_key(self, url):
+        """并发合并使用的 key：优先笔记 ID，其次短链接缓存的笔记链接，最后原链接"""
+        target = url.strip()
+        if self.link_cache is not None:
+            short_key = ShortLinkCache.short_key(target)
+            if short_key:
+                # 只读查询，真正的查询（计入指标）在 fetch_note_page 中进行
+                target = self.link_cache.peek(short_key) or short_key
+        match = self.patterns['note_path'].search(urlparse(target).path)
+        if match:
+            return f"xhs:{match.group(1)}"
+        return f"xhs:{target.split('?')[0].rstrip('/')}"
+
     async def parse(self, url):
         """解析小红书链接（主入口）"""
+        if self.singleflight is None:
+            return await self._parse(url)
+        return await self.singleflight.do(self.flight_key(url), lambda: self._parse(url))
+
+    async def _parse(self, url):
         try:
-            html, final_url = await self.fetch_with_retry(url)
+            html, final_url = await self.fetch_note_page(url)
 
             if 'internal error' in html or '验证码' in html or 'captcha' in html:
                 return {'error': True, 'message': '页面返回错误或需要验证码'}
@@ -382,17 +571,23 @@ class AsyncXiaohongshuParser:
                 'noteId': self.extract_note_id(html, final_url),
                 'originalUrl': final_url,
                 'images': self.extract_images(html),
-                'videos': self.extract_videos(html),
                 'cover': None,
                 'contentType': 'text',
                 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
             }
 
+            # 智能分析
+            extracted_data = self.extract_all_json_data(html)
+            result['videos'] = self.extract_videos(html, extracted_data)
+            # 选中流 → 有序备用链接（选中流自身的 backupUrls，再到其他可用流）
+            result['videoFallbacks'] = {
+                self.clean_url(v['url']): v['backupUrls']
+                for v in extracted_data['livePhotoData']['videos']
+                if v.get('backupUrls')
+            }
             if result['videos']:
                 result['video'] = result['videos'][0]
 
-            # 智能分析
-            extracted_data = self.extract_all_json_data(html)
             media_analysis = self.analyze_media_structure(extracted_data)
             result['mediaAnalysis'] = media_analysis
 
@@ -0,0 +1,213 @@
+"""
+按字节预算规划帖子媒体
+source_max_size 只限制单个文件，几十张实况图的帖子加起来仍可能拉取数百 MB。
+这里根据 Extractor 的 downloads 列表和准入阶段的大小探测，在单帖预算与单会话（滑动窗口）预算内
+决定每个素材下载哪个版本：静态图优先，其次主视频，最后是实况图的动态部分（放不下时退化为静态图）；
+视频放不下时先沿码率阶梯改用放得下的低码率，仍放不下才退化为链接。规划结果写入日志，便于核对
+"""
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+try:
+    from .admission import AdmissionResult
+    from .metrics import metrics
+except ImportError:
+    from admission import AdmissionResult
+    from metrics import metrics
+
+
+# 探测不到大小时的估算值（字节）
+DEFAULT_ESTIMATES = {"image": 512 * 1024, "video": 16 * 1024 * 1024}
+
+# 规划优先级：数值越小越先分配预算
+ROLE_PRIORITY = {"image": 0, "still": 0, "cover": 1, "video": 2, "motion": 3}
+
+
+class PlannedAsset:
+    """一个素材的规划结果"""
+
+    def __init__(
+        self,
+        index: int,
+        kind: str,
+        role: str,
+        url: str,
+        size: int,
+        estimated: bool,
+        rungs: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.index = index  # 在帖子中的顺序
+        self.kind = kind  # image / video
+        self.role = role  # image / still / cover / video / motion
+        self.url = url
+        self.key: Optional[str] = None  # 改用低码率时为该码率的内容 key
+        self.size = size
+        self.estimated = estimated
+        self.rungs = rungs or []  # 更低的码率 [{"url", "key", "size"}]，按画质降序
+        self.fetch = False
+        self.downgraded = 0  # 为放进预算下降的码率档数
+        self.reason: Optional[str] = None
+
+    def downgrade(self, remaining: int) -> bool:
+        """改用放得进 remaining 字节的最高码率（大小已知的），成功返回 True"""
+        for i, rung in enumerate(self.rungs):
+            size = rung.get("size") or 0
+            if size and size <= remaining and rung.get("url"):
+                self.url, self.key, self.size = rung["url"], rung.get("key"), size
+                self.estimated = False
+                self.downgraded = i + 1
+                self.rungs = self.rungs[i + 1:]
+                return True
+        return False
+
+    def describe(self) -> str:
+        size = f"{'~' if self.estimated else ''}{self.size / 1024 / 1024:.2f}MB"
+        action = "fetch" if self.fetch else f"link ({self.reason})"
+        if self.fetch and self.downgraded:
+            action += f" (down {self.downgraded} rung{'s' if self.downgraded > 1 else ''})"
+        return f"#{self.index + 1} {self.role}: {size} -> {action}"
+
+
+class MediaPlan:
+    """一条帖子的下载计划"""
+
+    def __init__(self, assets: List[PlannedAsset], budget: Optional[int]):
+        self.assets = assets
+        self.budget = budget
+
+    @property
+    def images(self) -> List[str]:
+        return [a.url for a in self.assets if a.fetch and a.kind == "image"]
+
+    @property
+    def video_links(self) -> List[str]:
+        return [a.url for a in self.assets if a.fetch and a.kind == "video"]
+
+    @property
+    def content_keys(self) -> Dict[str, str]:
+        """改用低码率的视频：新链接 → 内容 key"""
+        return {a.url: a.key for a in self.assets if a.fetch and a.downgraded and a.key}
+
+    @property
+    def video_fallbacks(self) -> Dict[str, List[Dict[str, Any]]]:
+        """要下载的视频：链接 → 下载失败时依次尝试的更低码率"""
+        return {a.url: a.rungs for a in self.assets if a.fetch and a.kind == "video" and a.rungs}
+
+    @property
+    def links(self) -> List[PlannedAsset]:
+        """退化为链接的素材（实况图的动态部分放不下时不算，静态图仍会发送）"""
+        return [a for a in self.assets if not a.fetch and a.role != "motion"]
+
+    @property
+    def planned_bytes(self) -> int:
+        return sum(a.size for a in self.assets if a.fetch)
+
+    def describe(self) -> str:
+        budget = "unlimited" if self.budget is None else f"{self.budget / 1024 / 1024:.1f}MB"
+        lines = [
+            f"budget {budget}, planned {self.planned_bytes / 1024 / 1024:.2f}MB, "
+            f"fetch {sum(1 for a in self.assets if a.fetch)}/{len(self.assets)}"
+        ]
+        lines.extend(a.describe() for a in self.assets)
+        return "\n".join(lines)
+
+
+class ByteBudgetPlanner:
+    """单帖 + 单会话滑动窗口的字节预算规划"""
+
+    def __init__(self, post_budget: int = 0, chat_budget: int = 0, chat_window: float = 600):
+        """
+        Args:
+            post_budget: 单条帖子的字节预算，0 表示不限制
+            chat_budget: 单个会话在 chat_window 内的字节预算，0 表示不限制
+            chat_window: 会话预算的统计窗口（秒）
+        """
+        self.post_budget = post_budget
+        self.chat_budget = chat_budget
+        self.chat_window = chat_window
+        # {origin: deque[(时间, 字节数)]}
+        self._usage: Dict[str, Deque[Tuple[float, int]]] = {}
+
+    def chat_used(self, origin: str) -> int:
+        usage = self._usage.get(origin)
+        if not usage:
+            return 0
+        cutoff = time.time() - self.chat_window
+        while usage and usage[0][0] < cutoff:
+            usage.popleft()
+        if not usage:
+            del self._usage[origin]
+            return 0
+        return sum(size for _, size in usage)
+
+    def plan(
+        self,
+        origin: str,
+        downloads: List[Any],
+        admission: Optional[AdmissionResult] = None,
+    ) -> MediaPlan:
+        """为一条帖子生成下载计划，并把计划的字节数记入会话用量"""
+        assets = self._collect(downloads, admission)
+        budget = self._budget(origin)
+
+        remaining = budget
+        for asset in sorted(assets, key=lambda a: (ROLE_PRIORITY.get(a.role, 9), a.index)):
+            if admission is not None and not admission.allows(asset.url):
+                asset.reason = admission.rejected.get(asset.url) or admission.reason
+                continue
+            if remaining is not None and asset.size > remaining:
+                if asset.downgrade(remaining):
+                    metrics.incr("planner.downgraded")
+                else:
+                    asset.reason = "over budget"
+                    metrics.incr("planner.degraded")
+                    continue
+            asset.fetch = True
+            if remaining is not None:
+                remaining -= asset.size
+
+        plan = MediaPlan(assets, budget)
+        if plan.planned_bytes:
+            self._usage.setdefault(origin, deque()).append((time.time(), plan.planned_bytes))
+        return plan
+
+    def _budget(self, origin: str) -> Optional[int]:
+        limits = []
+        if self.post_budget:
+            limits.append(self.post_budget)
+        if self.chat_budget:
+            limits.append(max(0, self.chat_budget - self.chat_used(origin)))
+        return min(limits) if limits else None
+
+    @staticmethod
+    def _collect(downloads: List[Any], admission: Optional[AdmissionResult]) -> List[PlannedAsset]:
+        entries: List[Tuple[str, str, str, List[Dict[str, Any]]]] = []
+        for item in downloads:
+            if isinstance(item, str):
+                entries.append(("image", "image", item, []))
+            elif isinstance(item, dict):
+                kind = item.get("type")
+                if kind == "image":
+                    entries.append(("image", "image", item.get("url"), []))
+                elif kind == "video":
+                    entries.append(("image", "cover", item.get("cover"), []))
+                    entries.append(("video", "video", item.get("url"), item.get("fallbacks") or []))
+                elif kind == "live_photo":
+                    entries.append(("image", "still", item.get("image"), []))
+                    entries.append(
+                        ("video", "motion", item.get("video"), item.get("video_fallbacks") or [])
+                    )
+
+        assets = []
+        for kind, role, url, rungs in entries:
+            if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+                continue
+            size = admission.size_of(url) if admission is not None else None
+            estimated = not size
+            assets.append(
+                PlannedAsset(
+                    len(assets), kind, role, url, size or DEFAULT_ESTIMATES[kind], estimated, rungs
+                )
+            )
+        return assets
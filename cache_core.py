@@ -0,0 +1,286 @@
+"""
+插件通用缓存核心（W-TinyLFU 风格）
+少量热门作品被反复转发、大量长尾只出现一次，纯 LRU 会被一次性的大文件冲刷。
+这里用紧凑的 Count-Min 频率草图做准入判断：新条目先进入小窗口 LRU，
+离开窗口时只有比主区待淘汰条目更“热”才被接纳；容量按权重（字节数或条目数）计算
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+
+class CountMinSketch:
+    """4 位饱和计数的 Count-Min 草图，计数总量达到采样上限后整体减半（老化）"""
+
+    def __init__(self, expected_entries: int = 1024, depth: int = 4):
+        width = 16
+        while width < expected_entries:
+            width <<= 1
+        self.width = width
+        self.depth = depth
+        self._mask = width - 1
+        self._rows = [[0] * width for _ in range(depth)]
+        self._seeds = [0x9E3779B1 * (i + 1) for i in range(depth)]
+        self._additions = 0
+        self.sample_size = 10 * width
+
+    def _indexes(self, key: Hashable):
+        h = hash(key)
+        for seed in self._seeds:
+            yield ((h ^ seed) * 0x01000193 + (h >> 16)) & self._mask
+
+    def increment(self, key: Hashable):
+        added = False
+        for row, idx in zip(self._rows, self._indexes(key)):
+            if row[idx] < 15:
+                row[idx] += 1
+                added = True
+        if added:
+            self._additions += 1
+            if self._additions >= self.sample_size:
+                self._reset()
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[idx] for row, idx in zip(self._rows, self._indexes(key)))
+
+    def _reset(self):
+        for row in self._rows:
+            for i in range(self.width):
+                row[i] >>= 1
+        self._additions //= 2
+
+
+class TinyLFUCache:
+    """带频率准入与按权重淘汰的缓存"""
+
+    def __init__(
+        self,
+        capacity: int,
+        expected_entries: int = 1024,
+        window_ratio: float = 0.01,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        """
+        Args:
+            capacity: 容量（所有条目权重之和的上限）
+            expected_entries: 预计条目数，决定频率草图大小
+            window_ratio: 窗口 LRU 占总容量的比例
+            on_evict: 条目被淘汰或被拒绝准入时的回调 (key, value)
+        """
+        self.capacity = capacity
+        self.window_capacity = max(1, int(capacity * window_ratio))
+        self.main_capacity = max(0, capacity - self.window_capacity)
+        self.on_evict = on_evict
+        self.sketch = CountMinSketch(expected_entries)
+
+        # {key: (value, weight)}
+        self._window: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._main: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._window_weight = 0
+        self._main_weight = 0
+
+    def __len__(self) -> int:
+        return len(self._window) + len(self._main)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._window or key in self._main
+
+    @property
+    def weight(self) -> int:
+        return self._window_weight + self._main_weight
+
+    def items(self) -> Iterator[Tuple[Hashable, Any]]:
+        for segment in (self._main, self._window):
+            for key, (value, _) in list(segment.items()):
+                yield key, value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """查询并记录一次访问（未命中也计入频率）"""
+        self.sketch.increment(key)
+        for segment in (self._window, self._main):
+            entry = segment.get(key)
+            if entry is not None:
+                segment.move_to_end(key)
+                return entry[0]
+        return default
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """查询但不记录访问"""
+        for segment in (self._window, self._main):
+            entry = segment.get(key)
+            if entry is not None:
+                return entry[0]
+        return default
+
+    def put(self, key: Hashable, value: Any, weight: int = 1) -> bool:
+        """写入条目；返回该条目当前是否仍在缓存中（可能被准入策略拒绝）
+
+        已存在的条目原地更新，不重新经过准入判断
+        """
+        for segment in (self._window, self._main):
+            entry = segment.get(key)
+            if entry is not None and weight <= self.capacity:
+                segment[key] = (value, weight)
+                segment.move_to_end(key)
+                if segment is self._window:
+                    self._window_weight += weight - entry[1]
+                    self._drain_window()
+                else:
+                    self._main_weight += weight - entry[1]
+                    self._trim_main(keep=key)
+                return key in self
+        self.pop(key)
+        if weight > self.capacity:
+            self._evicted(key, value)
+            return False
+
+        self._window[key] = (value, weight)
+        self._window_weight += weight
+        self._drain_window()
+        return key in self
+
+    def load(self, key: Hashable, value: Any, weight: int = 1):
+        """直接放入主区（用于启动时恢复已有条目），超出容量时淘汰最旧的"""
+        self.pop(key)
+        self._main[key] = (value, weight)
+        self._main_weight += weight
+        self._trim_main()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """移除条目（不触发 on_evict）"""
+        entry = self._window.pop(key, None)
+        if entry is not None:
+            self._window_weight -= entry[1]
+            return entry[0]
+        entry = self._main.pop(key, None)
+        if entry is not None:
+            self._main_weight -= entry[1]
+            return entry[0]
+        return default
+
+    def _admit(self, key: Hashable, value: Any, weight: int):
+        """窗口淘汰出的候选与主区 LRU 端的受害者比较频率，更热的一方留下"""
+        free = self.main_capacity - self._main_weight
+        if weight <= free:
+            self._main[key] = (value, weight)
+            self._main_weight += weight
+            return
+
+        victims = []
+        for victim_key, (_, victim_weight) in self._main.items():
+            if free >= weight:
+                break
+            victims.append(victim_key)
+            free += victim_weight
+        if free < weight:
+            self._evicted(key, value)
+            return
+
+        candidate_freq = self.sketch.estimate(key)
+        if any(self.sketch.estimate(v) >= candidate_freq for v in victims):
+            self._evicted(key, value)
+            return
+
+        for victim_key in victims:
+            victim_value, victim_weight = self._main.pop(victim_key)
+            self._main_weight -= victim_weight
+            self._evicted(victim_key, victim_value)
+        self._main[key] = (value, weight)
+        self._main_weight += weight
+
+    def _drain_window(self):
+        while self._window_weight > self.window_capacity and self._window:
+            cand_key, (cand_value, cand_weight) = self._window.popitem(last=False)
+            self._window_weight -= cand_weight
+            self._admit(cand_key, cand_value, cand_weight)
+
+    def _trim_main(self, keep: Optional[Hashable] = None):
+        while self._main_weight > self.main_capacity and self._main:
+            old_key = next(iter(self._main))
+            if old_key == keep and len(self._main) == 1:
+                break
+            old_value, old_weight = self._main.pop(old_key)
+            self._main_weight -= old_weight
+            self._evicted(old_key, old_value)
+
+    def _evicted(self, key: Hashable, value: Any):
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+
+class LRUCache:
+    """按权重淘汰的纯 LRU，作为模拟对比基线"""
+
+    def __init__(self, capacity: int, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.capacity = capacity
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self.weight = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, weight: int = 1) -> bool:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.weight -= old[1]
+        if weight > self.capacity:
+            return False
+        self._entries[key] = (value, weight)
+        self.weight += weight
+        while self.weight > self.capacity:
+            old_key, (old_value, old_weight) = self._entries.popitem(last=False)
+            self.weight -= old_weight
+            if self.on_evict is not None:
+                self.on_evict(old_key, old_value)
+        return key in self._entries
+
+
+class TraceRecorder:
+    """把缓存访问记录为 “时间戳 key 权重” 行，供 cache_sim.py 回放"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+
+    def record(self, key: str, weight: int = 1):
+        if not self.path or not key:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(f"{int(time.time())} {key} {int(weight)}\n")
+        except Exception:
+            pass
+
+
+def simulate(trace, capacity: int, expected_entries: int = 1024) -> Dict[str, Dict[str, float]]:
+    """回放访问序列 [(key, weight), ...]，比较 TinyLFU 与 LRU 的命中率"""
+    policies = {
+        "tinylfu": TinyLFUCache(capacity, expected_entries=expected_entries),
+        "lru": LRUCache(capacity),
+    }
+    results = {}
+    for name, cache in policies.items():
+        hits = requests = hit_weight = total_weight = 0
+        for key, weight in trace:
+            requests += 1
+            total_weight += weight
+            if cache.get(key) is not None:
+                hits += 1
+                hit_weight += weight
+            else:
+                cache.put(key, True, weight)
+        results[name] = {
+            "requests": requests,
+            "hit_ratio": hits / requests if requests else 0.0,
+            "byte_hit_ratio": hit_weight / total_weight if total_weight else 0.0,
+        }
+    return results
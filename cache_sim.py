@@ -0,0 +1,66 @@
+"""
+缓存策略模拟器：在记录的访问日志上比较 TinyLFU 与纯 LRU 的命中率
+
+日志格式（由 record_cache_trace 配置开启后写入 data/cache_trace.log）：
+    <时间戳> <key> <权重>
+每行一次访问，权重为字节数（媒体）或 1（详情）。也接受只有 “<key> [权重]” 的行。
+
+用法：
+    python cache_sim.py data/cache_trace.log --capacity 1024M
+    python cache_sim.py data/cache_trace.log --capacity 256 --prefix detail:
+"""
+import argparse
+from typing import List, Tuple
+
+try:
+    from .cache_core import simulate
+except ImportError:
+    from cache_core import simulate
+
+
+def parse_size(value: str) -> int:
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def load_trace(path: str, prefix: str = "") -> List[Tuple[str, int]]:
+    trace = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if len(parts) >= 3 and parts[0].isdigit():
+                parts = parts[1:]
+            key = parts[0]
+            if prefix and not key.startswith(prefix):
+                continue
+            weight = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
+            trace.append((key, max(1, weight)))
+    return trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TinyLFU vs LRU 缓存模拟")
+    parser.add_argument("trace", help="访问日志路径")
+    parser.add_argument("--capacity", required=True, help="缓存容量，支持 K/M/G 后缀")
+    parser.add_argument("--prefix", default="", help="只回放以该前缀开头的 key")
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace, args.prefix)
+    unique = len({key for key, _ in trace})
+    results = simulate(trace, parse_size(args.capacity), expected_entries=max(16, unique))
+
+    print(f"请求数: {len(trace)}, 不同 key: {unique}, 容量: {args.capacity}")
+    for name, stats in results.items():
+        print(
+            f"{name:>8}: 命中率 {stats['hit_ratio']:.2%}, "
+            f"字节命中率 {stats['byte_hit_ratio']:.2%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
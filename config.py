@@ -47,6 +47,47 @@ class MediaParserConfig:
     def common_timeout(self):
         return self._to_int(self.config.get("common_timeout", 15), 15, 3, 600)  # seconds
 
+    @property
+    def http_limit_per_host(self):
+        """单主机连接数上限；0 表示按 并发下载数 × 发送 worker 数 自动计算"""
+        configured = self._to_int(self.config.get("http_limit_per_host", 0), 0, 0, 256)
+        if configured:
+            return configured
+        # 每个 worker：下载槽位（准入阶段最多 6 个探测并发）+ 3 个卡片素材
+        return max(8, self.send_workers * (max(self.download_concurrency, 6) + 3))
+
+    @property
+    def download_concurrency(self):
+        return self._to_int(self.config.get("download_concurrency", 3), 3, 1, 16)
+
+    @property
+    def download_lookahead(self):
+        return self._to_int(self.config.get("download_lookahead", 6), 6, 1, 64)
+
+    @property
+    def send_workers(self):
+        return self._to_int(self.config.get("send_workers", 4), 4, 1, 32)
+
+    @property
+    def card_asset_timeout(self):
+        return self._to_int(self.config.get("card_asset_timeout", 5), 5, 1, 60)  # seconds
+
+    @property
+    def adaptive_quality(self):
+        return bool(self.config.get("adaptive_quality", True))
+
+    @property
+    def download_latency_target(self):
+        return self._to_int(self.config.get("download_latency_target", 60), 60, 5, 600)
+
+    @property
+    def post_byte_budget(self):
+        return self._to_int(self.config.get("post_byte_budget", 0), 0, 0, 102400)  # MB
+
+    @property
+    def chat_byte_budget(self):
+        return self._to_int(self.config.get("chat_byte_budget", 0), 0, 0, 102400)  # MB / 10 min
+
     @property
     def show_download_fail_tip(self):
         return bool(self.config.get("show_download_fail_tip", True))
@@ -72,6 +113,33 @@ class MediaParserConfig:
             return ""
         return raw
 
+    @property
+    def state_backend(self):
+        raw = str(self.config.get("state_backend", "") or "").strip()
+        if raw == "sqlite" or raw.startswith(("sqlite://", "redis://")):
+            return raw
+        return ""
+
+    @property
+    def media_cache_size(self):
+        return self._to_int(self.config.get("media_cache_size", 1024), 1024, 0, 102400)  # MB
+
+    @property
+    def media_cache_dir(self):
+        return str(self.config.get("media_cache_dir", "") or "").strip()
+
+    @property
+    def media_cache_shared(self):
+        return bool(self.config.get("media_cache_shared", False))
+
+    @property
+    def record_cache_trace(self):
+        return bool(self.config.get("record_cache_trace", False))
+
+    @property
+    def douyin_identity_pool_size(self):
+        return self._to_int(self.config.get("douyin_identity_pool_size", 3), 3, 1, 16)
+
     @property
     def douyin_info_render_mode(self):
         mode = self.config.get("douyin_info_render_mode", "image")
@@ -2,19 +2,32 @@
 import time
 import random
 from collections import defaultdict
-from typing import Dict, Union, Callable
+from typing import Dict, Optional, Union, Callable
+
+from astrbot.api import logger
+
+try:
+    from .state_backend import StateBackend, StateBackendError
+except ImportError:
+    from state_backend import StateBackend, StateBackendError
 
 
 class Debouncer:
     """防抖器，防止短时间内重复解析同一链接（支持动态配置）"""
 
-    def __init__(self, interval: Union[int, Callable[[], int]]):
+    def __init__(
+        self,
+        interval: Union[int, Callable[[], int]],
+        backend: Optional[StateBackend] = None,
+    ):
         """初始化防抖器
 
         Args:
             interval: 防抖时间间隔（秒），可以是固定值或返回int的函数
+            backend: 共享状态后端，设置后防抖窗口在多个实例间共享
         """
         self._interval = interval
+        self.backend = backend
         # 链接缓存：{session_id: {link: timestamp}}
         self.link_cache: Dict[str, Dict[str, float]] = defaultdict(dict)
         # 资源ID缓存：{session_id: {resource_id: timestamp}}
@@ -79,6 +92,24 @@ class Debouncer:
         self.resource_cache[session_id][resource_id] = now
         return False
 
+    async def check_link(self, session_id: str, link: str) -> bool:
+        """hit_link 的共享版本：有共享后端时用 SET NX 抢占防抖窗口，后端不可用时退回本地"""
+        return await self._check_shared("link", session_id, link, self.hit_link)
+
+    async def _check_shared(self, kind: str, session_id: str, item: str, local) -> bool:
+        if self.interval == 0:
+            return False
+        if self.backend is not None:
+            try:
+                key = f"debounce:{kind}:{session_id}:{item}"
+                acquired = await self.backend.set_nx(key, str(time.time()), ttl=self.interval)
+                # 本地同时记录一份，后端故障时仍能防抖
+                local(session_id, item)
+                return not acquired
+            except StateBackendError as e:
+                logger.warning(f"[debounce] 共享后端不可用，使用本地防抖: {e}")
+        return local(session_id, item)
+
     def clear_expired(self):
         """清理过期的缓存记录"""
         now = time.time()
@@ -0,0 +1,224 @@
+"""
+抖音作品详情缓存
+按 aweme_id 缓存 Extractor.extract_data 的结果，有效期取自结果中签名 CDN 链接的过期参数，
+临近过期时先返回旧数据并在后台刷新（stale-while-revalidate）。
+配置共享状态后端时，本地未命中会再查询后端，多个实例共用同一份详情
+"""
+import re
+import json
+import time
+import copy
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+    from .cache_core import TinyLFUCache, TraceRecorder
+    from .state_backend import StateBackend, StateBackendError
+except ImportError:
+    from metrics import metrics
+    from cache_core import TinyLFUCache, TraceRecorder
+    from state_backend import StateBackend, StateBackendError
+
+
+# 签名链接中常见的过期时间参数（Unix 秒）
+EXPIRY_QUERY_KEYS = ("x-expires", "expires", "x-oss-expires", "expire")
+# douyinvod 等视频 CDN 把十六进制过期时间放在路径里：/<签名>/<过期时间hex>/video/...
+HEX_TS_SEGMENT = re.compile(r"^[0-9a-f]{8}$")
+
+
+def iter_urls(value: Any) -> Iterable[str]:
+    """递归遍历结果中的所有 http 链接"""
+    if isinstance(value, str):
+        if value.startswith(("http://", "https://")):
+            yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from iter_urls(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from iter_urls(item)
+
+
+def url_expiry(url: str, now: Optional[float] = None) -> Optional[float]:
+    """从签名链接中解析过期时间戳，解析不到返回 None"""
+    now = now or time.time()
+    try:
+        parsed = urlparse(url)
+    except Exception:
+        return None
+
+    query = parse_qs(parsed.query)
+    for key in EXPIRY_QUERY_KEYS:
+        values = query.get(key)
+        if values and values[0].isdigit():
+            return float(values[0])
+
+    # 只接受落在合理区间内的十六进制时间戳，避免把其他路径段误判为过期时间
+    for segment in parsed.path.split("/"):
+        if HEX_TS_SEGMENT.match(segment):
+            ts = int(segment, 16)
+            if now - 86400 < ts < now + 30 * 86400:
+                return float(ts)
+    return None
+
+
+class DetailCache:
+    """带 CDN 过期感知与后台刷新的详情缓存（TinyLFU 准入，条目数有界）"""
+
+    def __init__(
+        self,
+        max_entries=256,
+        default_ttl=600,
+        max_ttl=6 * 3600,
+        safety_margin=120,
+        stale_ratio=0.8,
+        refresher: Optional[Callable[[str], Awaitable[Optional[dict]]]] = None,
+        trace: Optional[TraceRecorder] = None,
+        backend: Optional[StateBackend] = None,
+    ):
+        """
+        Args:
+            max_entries: 最大缓存条目数
+            default_ttl: 结果中没有可解析过期时间时的有效期（秒）
+            max_ttl: 有效期上限（秒）
+            safety_margin: 在链接过期前提前多少秒视为失效，留出下载时间
+            stale_ratio: 有效期过去多少比例后进入“旧数据”阶段并触发后台刷新
+            refresher: 后台刷新函数，参数为 aweme_id
+            trace: 访问日志记录器，供 cache_sim.py 回放
+            backend: 共享状态后端，为空时只使用进程内缓存
+        """
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self.safety_margin = safety_margin
+        self.stale_ratio = stale_ratio
+        self.refresher = refresher
+        self.trace = trace
+        self.backend = backend
+
+        # {aweme_id: (value, stale_at, expires_at)}
+        self._entries = TinyLFUCache(
+            max_entries,
+            expected_entries=max_entries * 4,
+            on_evict=lambda key, value: metrics.incr("detail_cache.evict"),
+        )
+        self._refreshing: Set[str] = set()
+
+    def get(self, key: str) -> Tuple[Optional[dict], bool]:
+        """查询缓存
+
+        Returns:
+            (结果副本, 是否需要后台刷新)；未命中时结果为 None
+        """
+        if self.trace:
+            self.trace.record(f"detail:{key}")
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is None or now >= entry[2]:
+            if entry is not None:
+                self._entries.pop(key)
+            metrics.incr("detail_cache.miss")
+            return None, False
+
+        value, stale_at, _ = entry
+        stale = now >= stale_at
+        metrics.incr("detail_cache.stale" if stale else "detail_cache.hit")
+        return copy.deepcopy(value), stale
+
+    def put(self, key: str, value: dict) -> Optional[Tuple[float, float]]:
+        """写入本地缓存，返回 (stale_at, expires_at)；已过期的结果不缓存"""
+        now = time.time()
+        expires_at = self._compute_expiry(value, now)
+        if expires_at <= now:
+            return None
+        stale_at = now + (expires_at - now) * self.stale_ratio
+        self._entries.put(key, (copy.deepcopy(value), stale_at, expires_at))
+        return stale_at, expires_at
+
+    async def lookup(self, key: str) -> Tuple[Optional[dict], bool]:
+        """先查本地，未命中时查询共享后端（其他实例刚解析过的结果）"""
+        value, stale = self.get(key)
+        if value is not None or self.backend is None:
+            return value, stale
+        try:
+            raw = await self.backend.get(f"detail:{key}")
+        except StateBackendError as e:
+            logger.warning(f"[detail_cache] 读取共享详情失败: {e}")
+            return None, False
+        if not raw:
+            return None, False
+        try:
+            data = json.loads(raw)
+            value, stale_at, expires_at = data["value"], data["stale_at"], data["expires_at"]
+        except (ValueError, KeyError, TypeError):
+            return None, False
+        now = time.time()
+        if now >= expires_at:
+            return None, False
+        self._entries.put(key, (value, stale_at, expires_at))
+        metrics.incr("detail_cache.shared_hit")
+        return copy.deepcopy(value), now >= stale_at
+
+    async def store(self, key: str, value: dict):
+        """写入本地缓存并同步到共享后端"""
+        times = self.put(key, value)
+        if times is None or self.backend is None:
+            return
+        stale_at, expires_at = times
+        try:
+            payload = json.dumps(
+                {"value": value, "stale_at": stale_at, "expires_at": expires_at},
+                ensure_ascii=False,
+            )
+            await self.backend.set(f"detail:{key}", payload, ttl=expires_at - time.time())
+        except (TypeError, ValueError) as e:
+            logger.warning(f"[detail_cache] 详情无法序列化，不共享: {e}")
+        except StateBackendError as e:
+            logger.warning(f"[detail_cache] 写入共享详情失败: {e}")
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    def refresh(self, key: str):
+        """后台刷新一个条目（同一 key 同时只刷新一次）"""
+        if self.refresher is None or key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        asyncio.create_task(self._do_refresh(key))
+
+    async def _do_refresh(self, key: str):
+        try:
+            value = await self.refresher(key)
+            if value:
+                await self.store(key, value)
+                metrics.incr("detail_cache.refresh")
+        except Exception as e:
+            logger.warning(f"[detail_cache] 后台刷新 {key} 失败: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    def stats(self) -> Dict[str, float]:
+        hit = int(metrics.get("detail_cache.hit"))
+        stale = int(metrics.get("detail_cache.stale"))
+        miss = int(metrics.get("detail_cache.miss"))
+        shared_hit = int(metrics.get("detail_cache.shared_hit"))
+        total = hit + stale + miss
+        return {
+            "entries": len(self._entries),
+            "hit": hit,
+            "stale": stale,
+            "shared_hit": shared_hit,
+            "miss": miss,
+            "hit_ratio": (hit + stale + shared_hit) / total if total else 0.0,
+        }
+
+    def _compute_expiry(self, value: dict, now: float) -> float:
+        """取所有签名链接中最早的过期时间，减去安全余量"""
+        expiries = [ts for ts in (url_expiry(u, now) for u in iter_urls(value)) if ts]
+        if not expiries:
+            return now + self.default_ttl
+        return min(min(expiries) - self.safety_margin, now + self.max_ttl)
@@ -0,0 +1,149 @@
+"""
+进行中的媒体下载登记表
+同一资源（按规范化 URL 或内容 key）同时只下载一次，所有请求方共享同一个只读文件，
+按引用计数管理，最后一个使用者释放后删除文件
+"""
+import os
+import stat
+import asyncio
+import tempfile
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlparse, urlunparse
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+def normalize_url(url: str) -> str:
+    """规范化 URL：主机小写，去掉片段"""
+    try:
+        parsed = urlparse(url.strip())
+    except Exception:
+        return url
+    return urlunparse(parsed._replace(netloc=parsed.netloc.lower(), fragment=""))
+
+
+class _Entry:
+    def __init__(self, key: str, path: str):
+        self.key = key
+        self.path = path
+        self.refs = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+class DownloadLease:
+    """一次下载结果的使用权，用完必须 release"""
+
+    def __init__(self, registry: "DownloadRegistry", entry: _Entry):
+        self._registry = registry
+        self._entry = entry
+        self._released = False
+
+    @property
+    def path(self) -> str:
+        return self._entry.path
+
+    @property
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self._entry.path)
+        except OSError:
+            return 0
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._registry._release(self._entry)
+
+
+class DownloadRegistry:
+    """按 key 合并并发下载，引用计数清理"""
+
+    def __init__(self, base_dir: Optional[str] = None):
+        """
+        Args:
+            base_dir: 下载文件存放目录，为空时使用系统临时目录
+        """
+        self.base_dir = base_dir
+        self._entries: Dict[str, _Entry] = {}
+
+    async def acquire(
+        self,
+        key: str,
+        fetch: Callable[[str], Awaitable[bool]],
+        suffix: str = "",
+    ) -> Optional[DownloadLease]:
+        """获取资源文件；没有进行中的下载时调用 fetch(path) 下载
+
+        Returns:
+            成功时返回 DownloadLease，失败返回 None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            if self.base_dir:
+                os.makedirs(self.base_dir, exist_ok=True)
+            fd, path = tempfile.mkstemp(suffix=suffix, dir=self.base_dir)
+            os.close(fd)
+            entry = _Entry(key, path)
+            entry.task = asyncio.ensure_future(self._run(entry, fetch))
+            self._entries[key] = entry
+            metrics.incr("download.started")
+        else:
+            metrics.incr("download.shared")
+
+        entry.refs += 1
+        try:
+            ok = await asyncio.shield(entry.task)
+        except BaseException:
+            self._release(entry)
+            raise
+        if not ok:
+            self._release(entry)
+            return None
+        return DownloadLease(self, entry)
+
+    def in_flight(self) -> int:
+        return len(self._entries)
+
+    async def _run(self, entry: _Entry, fetch: Callable[[str], Awaitable[bool]]) -> bool:
+        try:
+            ok = await fetch(entry.path)
+            ok = bool(ok) and os.path.exists(entry.path) and os.path.getsize(entry.path) > 0
+        except Exception as e:
+            logger.error(f"[download] 下载异常 {entry.key}: {e}")
+            ok = False
+        if ok:
+            # 共享文件只读，防止某个使用者改写
+            os.chmod(entry.path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        else:
+            # 失败的登记立即移除，后续请求重新下载
+            self._forget(entry)
+        if entry.refs <= 0:
+            # 所有请求方都已取消等待
+            self._forget(entry)
+            self._unlink(entry.path)
+        return ok
+
+    def _release(self, entry: _Entry):
+        entry.refs -= 1
+        if entry.refs > 0 or (entry.task is not None and not entry.task.done()):
+            return
+        self._forget(entry)
+        self._unlink(entry.path)
+
+    def _forget(self, entry: _Entry):
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            if os.path.exists(path):
+                os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+                os.unlink(path)
+        except Exception as e:
+            logger.warning(f"[download] 清理文件失败: {path}, {e}")
@@ -262,6 +262,9 @@ class ABogus:
 # 3. 数据提取器 (保持不变)
 # ==========================================
 class Extractor:
+    def __init__(self, max_size=0):
+        self.max_size = max_size or 0  # 单个视频大小上限（字节），用于码率选择
+
     @staticmethod
     def safe_extract(data, path, default=None):
         keys = path.split('.')
@@ -322,57 +325,124 @@ class Extractor:
                 result["downloads"] = []
                 for i in images:
                     if i.get("video"):
-                        video_url = self._get_best_video_url(i)
+                        video, fallbacks = self._select_video(i)
                         result["downloads"].append({
                             "type": "live_photo",
                             "image": self.safe_extract(i, "url_list[0]"),
-                            "video": video_url
+                            "image_key": self._content_key("image", i.get("uri")),
+                            "video": video["url"],
+                            "video_key": video["key"],
+                            "video_fallbacks": self._fallback_items(fallbacks)
                         })
                     else:
-                        result["downloads"].append(self.safe_extract(i, "url_list[0]"))
+                        result["downloads"].append(self._image_item(i))
             else:
                 result["type"] = "图集"
-                result["downloads"] = [self.safe_extract(i, "url_list[0]") for i in images]
+                result["downloads"] = [self._image_item(i) for i in images]
         else:
             result["type"] = "视频"
             duration_ms = self.safe_extract(data_dict, "video.duration", 0)
             result["duration"] = self.time_conversion(duration_ms)
             result["duration_seconds"] = duration_ms // 1000  # 添加秒数用于限制检查
-            video_url = self._get_best_video_url(data_dict)
+            video, fallbacks = self._select_video(data_dict)
             cover_url = self.safe_extract(data_dict, "video.cover.url_list[0]")
             result["downloads"] = [{
                 "type": "video",
-                "url": video_url,
-                "cover": cover_url
+                "url": video["url"],
+                "key": video["key"],
+                "fallbacks": self._fallback_items(fallbacks),
+                "cover": cover_url,
+                "cover_key": self._content_key(
+                    "image", self.safe_extract(data_dict, "video.cover.uri")
+                )
             }]
 
         return result
 
-    def _get_best_video_url(self, data):
-        bit_rate = self.safe_extract(data, "video.bit_rate", [])
-        if not bit_rate:
+    @staticmethod
+    def _content_key(kind: str, uri, variant=None):
+        """
+        稳定的内容 key：签名 URL 每次请求都会变化（CDN 节点、过期时间），
+        uri 与所选码率则对同一份字节保持不变，供缓存/去重使用
+        """
+        if not uri:
+            return None
+        key = f"dy:{kind}:{uri}"
+        if variant:
+            key += f":{variant}"
+        return key
+
+    @staticmethod
+    def _fallback_items(rungs):
+        return [{"url": r["url"], "key": r["key"], "size": r["size"]} for r in rungs]
+
+    def _image_item(self, image):
+        return {
+            "type": "image",
+            "url": self.safe_extract(image, "url_list[0]"),
+            "key": self._content_key("image", image.get("uri"))
+        }
+
+    def _select_video(self, data):
+        """
+        在大小上限内选出画质最高的码率，返回 (选中项, 备选列表)
+        备选为同样不超限、画质依次降低的码率，下载中途失败时按顺序回退
+        """
+        ladder = self._video_ladder(data)
+        if not ladder:
             # 回退：取 url_list 最后一个（最稳定的CDN节点）
             url_list = self.safe_extract(data, "video.play_addr.url_list", [])
-            return url_list[-1] if url_list else ""
+            fallback_uri = self.safe_extract(data, "video.play_addr.uri")
+            return {
+                "url": url_list[-1] if url_list else "",
+                "key": self._content_key("video", fallback_uri),
+                "size": 0,
+            }, []
+        return self.select_rung(ladder, self.max_size)
+
+    @staticmethod
+    def select_rung(ladder, max_size=0):
+        """
+        从按画质降序排列的码率阶梯中选择：跳过超过 max_size 的码率（大小未知的保留），
+        全部超限时取最小的一项（交给准入阶段拒绝）
+        """
+        fitting = [r for r in ladder if not max_size or not r["size"] or r["size"] <= max_size]
+        if not fitting:
+            return min(ladder, key=lambda r: r["size"]), []
+        return fitting[0], fitting[1:]
+
+    def _video_ladder(self, data):
+        """码率阶梯：每个可用码率一项，按 分辨率 → H.264 优先 → 帧率 → 码率 从高到低排列"""
+        fallback_uri = self.safe_extract(data, "video.play_addr.uri")
+        rungs = []
         try:
-            candidates = []
-            for i in bit_rate:
-                play_addr = i.get("play_addr", {})
-                candidates.append((
-                    i.get("FPS", 0),
-                    i.get("bit_rate", 0),
-                    play_addr.get("data_size", 0),
-                    play_addr.get("height", 0),
-                    play_addr.get("width", 0),
-                    play_addr.get("url_list", [])
-                ))
-            candidates.sort(key=lambda x: (max(x[3], x[4]), x[0], x[1], x[2]))
-            # 使用 url_list[-1]（最后一个CDN节点，最稳定）
-            url_list = candidates[-1][-1] if candidates else []
-            return url_list[-1] if url_list else ""
+            for i in self.safe_extract(data, "video.bit_rate", []) or []:
+                play_addr = i.get("play_addr") or {}
+                url_list = play_addr.get("url_list") or []
+                if not url_list:
+                    continue
+                bit_rate = i.get("bit_rate", 0) or 0
+                codec = "h265" if i.get("is_h265") or i.get("is_bytevc1") else "h264"
+                # 同一视频的 H.264/H.265 码率可能共用 uri 和 bit_rate，key 中带上编码和档位名避免串用
+                variant = ":".join(str(v) for v in (codec, i.get("gear_name"), bit_rate) if v)
+                rungs.append({
+                    # 使用 url_list[-1]（最后一个CDN节点，最稳定）
+                    "url": url_list[-1],
+                    "key": self._content_key("video", play_addr.get("uri") or fallback_uri, variant),
+                    "size": play_addr.get("data_size", 0) or 0,
+                    "resolution": max(play_addr.get("height", 0) or 0, play_addr.get("width", 0) or 0),
+                    # H.265 同画质体积更小，但部分客户端播放兼容性较差，同分辨率下优先 H.264
+                    "codec": codec,
+                    "fps": i.get("FPS", 0) or 0,
+                    "bit_rate": bit_rate,
+                })
         except Exception:
-            url_list = self.safe_extract(data, "video.play_addr.url_list", [])
-            return url_list[-1] if url_list else ""
+            return []
+        rungs.sort(
+            key=lambda r: (r["resolution"], r["codec"] == "h264", r["fps"], r["bit_rate"], r["size"]),
+            reverse=True,
+        )
+        return rungs
 
 # ==========================================
 # 4. 下载器核心
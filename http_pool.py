@@ -0,0 +1,156 @@
+"""
+插件级共享 HTTP 连接池
+抖音与小红书解析共用一个 TCPConnector（按主机限流 + keep-alive + DNS 缓存），
+每次请求仍然创建独立的 ClientSession；CookieJar 由调用方传入，
+抖音解析传入的是租用身份的 CookieJar，租用同一身份的并发解析会共享它（身份之间互相隔离）
+"""
+import time
+import asyncio
+from typing import Optional, Dict
+
+import aiohttp
+from aiohttp.abc import AbstractCookieJar
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+class HttpPool:
+    """共享连接器 + 空闲回收"""
+
+    def __init__(
+        self,
+        limit=100,
+        limit_per_host=8,
+        keepalive_timeout=60,
+        dns_ttl=300,
+        idle_timeout=600,
+    ):
+        """
+        Args:
+            limit: 连接总数上限
+            limit_per_host: 单个主机的连接数上限
+            keepalive_timeout: 空闲 keep-alive 连接保留秒数
+            dns_ttl: DNS 缓存秒数
+            idle_timeout: 整个连接池无任何活动多少秒后关闭连接器（下次请求再重建）
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.idle_timeout = idle_timeout
+
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._trace = self._build_trace_config()
+        self._last_active = time.monotonic()
+        self._reaper_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def session(
+        self,
+        cookie_jar: Optional[AbstractCookieJar] = None,
+        timeout: Optional[aiohttp.ClientTimeout] = None,
+    ) -> aiohttp.ClientSession:
+        """基于共享连接器创建一个 session；关闭 session 不会关闭连接器"""
+        self._ensure_reaper()
+        self._last_active = time.monotonic()
+        return aiohttp.ClientSession(
+            connector=self._get_connector(),
+            connector_owner=False,
+            cookie_jar=cookie_jar,
+            timeout=timeout or aiohttp.ClientTimeout(total=30),
+            trace_configs=[self._trace],
+        )
+
+    def stats(self) -> Dict[str, int]:
+        created = int(metrics.get("http.conn_created"))
+        reused = int(metrics.get("http.conn_reused"))
+        return {
+            "created": created,
+            "reused": reused,
+            "dns_hit": int(metrics.get("http.dns_hit")),
+            "dns_miss": int(metrics.get("http.dns_miss")),
+            "reuse_ratio": reused / (created + reused) if created + reused else 0.0,
+        }
+
+    async def close(self):
+        self._closed = True
+        if self._reaper_task and not self._reaper_task.done():
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._reaper_task = None
+        await self._close_connector()
+
+    def _get_connector(self) -> aiohttp.TCPConnector:
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_ttl,
+                use_dns_cache=True,
+                enable_cleanup_closed=True,
+            )
+        return self._connector
+
+    async def _close_connector(self):
+        if self._connector is not None and not self._connector.closed:
+            await self._connector.close()
+        self._connector = None
+
+    def _ensure_reaper(self):
+        if self._closed:
+            return
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reap_loop())
+
+    async def _reap_loop(self):
+        """长时间无活动时释放全部空闲连接"""
+        interval = max(10, self.idle_timeout // 4)
+        while not self._closed:
+            await asyncio.sleep(interval)
+            if self._connector is None:
+                continue
+            idle = time.monotonic() - self._last_active
+            if idle >= self.idle_timeout:
+                logger.debug(f"[http] 连接池空闲 {int(idle)}s，释放连接")
+                await self._close_connector()
+
+    def _touch(self):
+        self._last_active = time.monotonic()
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        """统计新建/复用连接和 DNS 缓存命中，用于观察握手节省情况"""
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self._touch()
+
+        async def on_chunk_received(session, ctx, params):
+            self._touch()
+
+        async def on_conn_created(session, ctx, params):
+            metrics.incr("http.conn_created")
+
+        async def on_conn_reused(session, ctx, params):
+            metrics.incr("http.conn_reused")
+
+        async def on_dns_hit(session, ctx, params):
+            metrics.incr("http.dns_hit")
+
+        async def on_dns_miss(session, ctx, params):
+            metrics.incr("http.dns_miss")
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_response_chunk_received.append(on_chunk_received)
+        trace.on_connection_create_end.append(on_conn_created)
+        trace.on_connection_reuseconn.append(on_conn_reused)
+        trace.on_dns_cache_hit.append(on_dns_hit)
+        trace.on_dns_cache_miss.append(on_dns_miss)
+        return trace
@@ -0,0 +1,191 @@
+"""
+短链接解析缓存
+v.douyin.com / v.iesdouyin.com / xhslink.com 短码到作品（aweme_id / 笔记链接）的映射不会变化，
+以 LRU 方式保存在本地 sqlite 文件中，重复分享时直接跳过重定向请求，重启后依然有效；
+配置共享状态后端时映射同时写入后端，其他实例可直接复用
+"""
+import os
+import time
+import sqlite3
+from collections import OrderedDict
+from typing import Optional, Dict
+from urllib.parse import urlparse
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+    from .state_backend import StateBackend, StateBackendError
+    from .url_classifier import SHORT_LINK_HOSTS
+except ImportError:
+    from metrics import metrics
+    from state_backend import StateBackend, StateBackendError
+    from url_classifier import SHORT_LINK_HOSTS
+
+
+# 共享后端中映射的保留时间（秒）
+SHARED_TTL = 30 * 86400
+
+
+class ShortLinkCache:
+    """短码 → 解析结果的持久化 LRU 映射"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries=5000,
+        backend: Optional[StateBackend] = None,
+    ):
+        """
+        Args:
+            path: sqlite 文件路径，为空时仅在内存中缓存
+            max_entries: 最大条目数，超出后淘汰最久未使用的条目
+            backend: 共享状态后端，为空时只使用本地缓存
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._open()
+
+    @staticmethod
+    def short_key(url: str) -> Optional[str]:
+        """短链接的缓存键（主机 + 短码路径），非短链接返回 None"""
+        try:
+            parsed = urlparse(url.strip())
+        except Exception:
+            return None
+        host = (parsed.hostname or "").lower()
+        if host not in SHORT_LINK_HOSTS:
+            return None
+        path = parsed.path.rstrip("/")
+        if not path:
+            return None
+        return f"{host.replace('www.', '')}{path}"
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        value = self._entries.get(key)
+        if value is None:
+            metrics.incr("link_cache.miss")
+            return None
+        self._entries.move_to_end(key)
+        metrics.incr("link_cache.hit")
+        self._execute(
+            "UPDATE short_links SET last_used = ? WHERE key = ?",
+            (time.time(), key),
+        )
+        return value
+
+    def peek(self, key: Optional[str]) -> Optional[str]:
+        """只读查询本地缓存：不计命中/未命中，不更新 LRU 顺序和 last_used"""
+        if not key:
+            return None
+        return self._entries.get(key)
+
+    def put(self, key: Optional[str], value: Optional[str]):
+        if not key or not value:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._execute(
+            "INSERT OR REPLACE INTO short_links (key, value, last_used) VALUES (?, ?, ?)",
+            (key, value, time.time()),
+        )
+        while len(self._entries) > self.max_entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self._execute("DELETE FROM short_links WHERE key = ?", (old_key,))
+
+    def invalidate(self, key: Optional[str]):
+        if not key:
+            return
+        self._entries.pop(key, None)
+        self._execute("DELETE FROM short_links WHERE key = ?", (key,))
+
+    async def lookup(self, key: Optional[str]) -> Optional[str]:
+        """先查本地，未命中时查询共享后端"""
+        value = self.get(key)
+        if value is not None or not key or self.backend is None:
+            return value
+        try:
+            value = await self.backend.get(f"short_link:{key}")
+        except StateBackendError as e:
+            logger.warning(f"[link_cache] 读取共享映射失败: {e}")
+            return None
+        if value:
+            metrics.incr("link_cache.shared_hit")
+            self.put(key, value)
+        return value
+
+    async def store(self, key: Optional[str], value: Optional[str]):
+        """写入本地缓存并同步到共享后端"""
+        if not key or not value:
+            return
+        self.put(key, value)
+        if self.backend is None:
+            return
+        try:
+            await self.backend.set(f"short_link:{key}", value, ttl=SHARED_TTL)
+        except StateBackendError as e:
+            logger.warning(f"[link_cache] 写入共享映射失败: {e}")
+
+    async def discard(self, key: Optional[str]):
+        """从本地和共享后端同时移除"""
+        self.invalidate(key)
+        if not key or self.backend is None:
+            return
+        try:
+            await self.backend.delete(f"short_link:{key}")
+        except StateBackendError as e:
+            logger.warning(f"[link_cache] 删除共享映射失败: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hit": int(metrics.get("link_cache.hit")),
+            "miss": int(metrics.get("link_cache.miss")),
+            "shared_hit": int(metrics.get("link_cache.shared_hit")),
+        }
+
+    def close(self):
+        if self._db is not None:
+            try:
+                self._db.close()
+            except Exception:
+                pass
+            self._db = None
+
+    def _open(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS short_links ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT key, value FROM short_links ORDER BY last_used DESC LIMIT ?",
+                (self.max_entries,),
+            ).fetchall()
+            for key, value in reversed(rows):
+                self._entries[key] = value
+            logger.info(f"[link_cache] 已加载 {len(self._entries)} 条短链接缓存")
+        except Exception as e:
+            logger.warning(f"[link_cache] 打开缓存文件失败，仅使用内存缓存: {e}")
+            self.close()
+
+    def _execute(self, sql: str, params: tuple):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(sql, params)
+            self._db.commit()
+        except Exception as e:
+            logger.warning(f"[link_cache] 写入失败: {e}")
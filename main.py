@@ -4,6 +4,7 @@
 """
 import re
 import os
+import time
 import asyncio
 import base64
 import tempfile
@@ -19,15 +20,52 @@ import astrbot.api.message_components as Comp
 try:
     from .config import MediaParserConfig
     from .debounce import Debouncer
+    from .state_backend import SqliteBackend, create_backend
+    from .shared_lease import LeaseManager
+    from .media_pipeline import OrderedPipeline
+    from .send_pacer import SendPacer, send_cost, throttle_info
+    from .send_queue import SendQueue
+    from .admission import AdmissionResult, MediaAdmission
+    from .budget_planner import ByteBudgetPlanner
+    from .quality_controller import QualityController
     from .async_dysk import AsyncDouyinDownloader
     from .async_xhs import AsyncXiaohongshuParser
+    from .token_store import DouyinTokenStore
+    from .http_pool import HttpPool
+    from .detail_cache import DetailCache
+    from .link_cache import ShortLinkCache
+    from .metrics import metrics
+    from .singleflight import SingleFlight
+    from .download_registry import DownloadRegistry, DownloadLease, normalize_url
+    from .media_cache import MediaCache
+    from .cache_core import TraceRecorder
 except ImportError:
     from config import MediaParserConfig
     from debounce import Debouncer
+    from state_backend import SqliteBackend, create_backend
+    from shared_lease import LeaseManager
+    from media_pipeline import OrderedPipeline
+    from send_pacer import SendPacer, send_cost, throttle_info
+    from send_queue import SendQueue
+    from admission import AdmissionResult, MediaAdmission
+    from budget_planner import ByteBudgetPlanner
+    from quality_controller import QualityController
     from async_dysk import AsyncDouyinDownloader
     from async_xhs import AsyncXiaohongshuParser
+    from token_store import DouyinTokenStore
+    from http_pool import HttpPool
+    from detail_cache import DetailCache
+    from link_cache import ShortLinkCache
+    from metrics import metrics
+    from singleflight import SingleFlight
+    from download_registry import DownloadRegistry, DownloadLease, normalize_url
+    from media_cache import MediaCache
+    from cache_core import TraceRecorder
 
 
+# Share of card_asset_timeout each info card asset may spend downloading
+CARD_ASSET_BUDGETS = {"cover": 1.0, "avatar": 0.6, "music_cover": 0.6}
+
 DOUYIN_INFO_CARD_TEMPLATE = """
 <div style="
   width: {{ card_width }}px;
@@ -348,10 +386,89 @@ class MediaParserPlugin(Star):
         super().__init__(context)
         # Configuration
         self.cfg = MediaParserConfig(config)
+        # Local state directory (token cache etc.)
+        self._data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+        # Optional state shared with other bot instances (debounce windows, parse results)
+        self.state_backend = create_backend(self.cfg.state_backend, self._data_dir)
         # Debouncer
-        self.debouncer = Debouncer(lambda: self.cfg.debounce_interval)
+        self.debouncer = Debouncer(
+            lambda: self.cfg.debounce_interval, backend=self.state_backend
+        )
+        # Plugin-wide HTTP connector shared by both parsers
+        limit_per_host = self.cfg.http_limit_per_host
+        self.http_pool = HttpPool(limit=max(100, limit_per_host * 2), limit_per_host=limit_per_host)
+        # Shared pool of warmed Douyin ttwid/msToken identities
+        self.dy_token_store = DouyinTokenStore(
+            enable_cf_proxy=self.cfg.enable_cf_proxy,
+            cf_proxy_url=self.cfg.cf_proxy_url,
+            size=self.cfg.douyin_identity_pool_size,
+            timeout=self.cfg.common_timeout,
+            persist_path=os.path.join(self._data_dir, "douyin_tokens.json"),
+            http_pool=self.http_pool,
+        )
+        # Optional cache access log for offline replay with cache_sim.py
+        cache_trace = TraceRecorder(
+            os.path.join(self._data_dir, "cache_trace.log")
+            if self.cfg.record_cache_trace
+            else None
+        )
+        # aweme detail cache, stale entries are refreshed in the background
+        self.detail_cache = DetailCache(
+            refresher=self._refresh_douyin_detail,
+            trace=cache_trace,
+            backend=self.state_backend,
+        )
+        # Persistent short-link -> content id map
+        self.link_cache = ShortLinkCache(
+            os.path.join(self._data_dir, "short_links.sqlite3"),
+            backend=self.state_backend,
+        )
+        # Coalesce concurrent parses of the same aweme_id / noteId
+        self.singleflight = SingleFlight()
+        # Shared in-flight media downloads (one transfer per asset)
+        self.download_registry = DownloadRegistry()
+        # Content-addressed on-disk media cache
+        self.media_cache = MediaCache(
+            self.cfg.media_cache_dir or os.path.join(self._data_dir, "media_cache"),
+            max_bytes=self.cfg.media_cache_size * 1024 * 1024,
+            trace=cache_trace,
+        )
+        # Cross-instance download leases; only useful when the other instances can read the
+        # files the lease holder publishes: a cache dir explicitly marked as shared storage,
+        # or a sqlite backend whose file sits in the same data dir as the cache (instances
+        # sharing that sqlite file then also share the cache dir)
+        cache_shared = self.cfg.media_cache_shared or (
+            isinstance(self.state_backend, SqliteBackend)
+            and self._under_data_dir(self.state_backend.path)
+            and self._under_data_dir(self.media_cache.cache_dir)
+        )
+        self.download_leases = (
+            LeaseManager(self.state_backend)
+            if self.state_backend and self.media_cache.enabled and cache_shared
+            else None
+        )
+        # Per-chat token-bucket send pacing (replaces fixed sleeps between media messages)
+        self.send_pacer = SendPacer()
+        # One ordered queue per chat, chats served in parallel by a shared worker pool
+        self.send_queue = SendQueue(workers=self.cfg.send_workers)
+        # Steps video selection down the bitrate ladder while downloads are slow
+        self.quality = QualityController(
+            latency_target=self.cfg.download_latency_target,
+            download_slots=self.cfg.download_concurrency * self.cfg.send_workers,
+            enabled=self.cfg.adaptive_quality,
+        )
+        # Per-post / per-chat byte budgets over which assets get downloaded
+        self.byte_planner = ByteBudgetPlanner(
+            post_budget=self.cfg.post_byte_budget * 1024 * 1024,
+            chat_budget=self.cfg.chat_byte_budget * 1024 * 1024,
+        )
         # Parsers
-        self.xhs_parser = AsyncXiaohongshuParser()
+        self.xhs_parser = AsyncXiaohongshuParser(
+            http_pool=self.http_pool,
+            link_cache=self.link_cache,
+            singleflight=self.singleflight,
+            max_size=self.cfg.max_size,
+        )
         self._font_urls = self._build_local_font_urls()
         # URL patterns
         self.dy_patterns = [
@@ -370,14 +487,26 @@ class MediaParserPlugin(Star):
         logger.info(f"最大文件大小: {self.cfg.source_max_size}MB")
         logger.info(f"最大视频时长: {self.cfg.source_max_minute}分钟")
         logger.info(f"抖音信息渲染模式: {self.cfg.douyin_info_render_mode}")
+        if self.state_backend:
+            logger.info(f"共享状态后端: {self.state_backend.name}")
         if self._font_urls:
             logger.info("已加载本地 HarmonyOS 字体资源")
 
     async def terminate(self):
         """Release parser resources on plugin unload."""
         logger.info("正在清理资源...")
+        if self.send_queue:
+            await self.send_queue.close()
         if self.xhs_parser:
             await self.xhs_parser.close()
+        if self.dy_token_store:
+            await self.dy_token_store.close()
+        if self.http_pool:
+            await self.http_pool.close()
+        if self.link_cache:
+            self.link_cache.close()
+        if self.state_backend:
+            await self.state_backend.close()
         logger.info("资源清理完成")
 
     @filter.event_message_type(filter.EventMessageType.ALL)
@@ -410,39 +539,60 @@ class MediaParserPlugin(Star):
             return
         # Debounce check
         check_url = dy_url or xhs_url
-        if self.debouncer.hit_link(umo, check_url):
+        if await self.debouncer.check_link(umo, check_url):
             logger.warning(
                 f"[debounce] Skip parsing duplicated link within interval: {check_url}"
             )
             return
 
-        # ========== 瑙ｆ瀽澶勭悊 ==========
+        # ========== 解析处理 ==========
+        # Detail fetch, card rendering and media downloads start right away, outside the
+        # send queue; only the sending waits for this post's turn in the chat's queue, so
+        # posts in one chat never interleave and send_workers does not cap parsing.
         if dy_url:
-            async for result in self.parse_douyin(event, dy_url):
-                yield result
-            event.stop_event()
-        elif xhs_url:
-            async for result in self.parse_xiaohongshu(event, xhs_url):
-                yield result
-            event.stop_event()
+            results = self.parse_douyin(event, dy_url)
+        else:
+            results = self.parse_xiaohongshu(event, xhs_url)
+        turn = asyncio.Event()
+        finished = asyncio.Event()
+
+        async def hold_turn():
+            turn.set()
+            await finished.wait()
+
+        async def run_post():
+            # The generator stays parked at its first yield until the turn comes; media
+            # sends inside it are gated on the card, so they follow the turn as well
+            try:
+                async for result in results:
+                    await turn.wait()
+                    await self._paced_send(event, result)
+            finally:
+                finished.set()
+
+        post = asyncio.create_task(run_post())
+        try:
+            await self.send_queue.submit(umo, hold_turn)
+            await post
+        finally:
+            if not post.done():
+                post.cancel()
+                await asyncio.gather(post, return_exceptions=True)
+        event.stop_event()
 
     # ==================== 鎶栭煶瑙ｆ瀽锛堝畬鍏ㄥ紓姝ワ級====================
 
     async def parse_douyin(self, event: AstrMessageEvent, url: str):
-        """Parse Douyin link asynchronously."""
+        """Parse Douyin link asynchronously.
+
+        Media downloads start as soon as the detail is extracted and run alongside
+        card rendering; media sends are held back until the card has been sent.
+        """
         try:
             logger.info(f"Start parsing Douyin link: {url}")
 
             # Create a new downloader per request to avoid session reuse issues.
-            dy_downloader = AsyncDouyinDownloader(
-                enable_cf_proxy=self.cfg.enable_cf_proxy,
-                cf_proxy_url=self.cfg.cf_proxy_url,
-                download_retry_times=self.cfg.download_retry_times,
-                download_timeout=self.cfg.download_timeout,
-                common_timeout=self.cfg.common_timeout,
-                max_size=self.cfg.max_size,
-                max_duration=self.cfg.max_duration,
-            )
+            dy_downloader = self._new_douyin_downloader()
 
             try:
                 result = await dy_downloader.get_detail(url)
@@ -457,56 +607,99 @@ class MediaParserPlugin(Star):
 
                 downloads = result.get("downloads", [])
                 images, video_links = self._extract_douyin_media(downloads)
+                content_keys = self._collect_content_keys(downloads)
+                video_fallbacks = self._collect_video_fallbacks(downloads)
                 media_bytes_cache: Dict[str, bytes] = {}
 
-                # Info render mode: text / image / both
-                render_mode = self.cfg.douyin_info_render_mode
-                if render_mode in {"image", "both"}:
-                    info_image_url = await self._render_douyin_info_image(
-                        result=result,
-                        image_count=len(images),
-                        video_count=len(video_links),
-                        dy_downloader=dy_downloader,
-                        media_bytes_cache=media_bytes_cache,
+                # Admission: duration limit + size/type probes, decided once before any
+                # download or rendering starts
+                admission = await self._admit_douyin_media(
+                    dy_downloader, result, images, video_links, video_fallbacks
+                )
+                if admission.substitutes:
+                    # Rejected videos continue from the lower rung that passed admission
+                    downloads = self._adopt_admitted_rungs(downloads, admission)
+                    images, video_links = self._extract_douyin_media(downloads)
+                    content_keys = self._collect_content_keys(downloads)
+                    video_fallbacks = self._collect_video_fallbacks(downloads)
+                warning_msg = admission.reason
+                if warning_msg:
+                    logger.warning(warning_msg)
+
+                # Start media downloads now; sends wait until the card is out
+                card_sent = asyncio.Event()
+                media_task = None
+                plan = None
+                if warning_msg is None:
+                    # Pick what to fetch within the post / chat byte budgets
+                    plan = self.byte_planner.plan(event.unified_msg_origin, downloads, admission)
+                    logger.info(f"Media plan for {result.get('id', url)}:\n{plan.describe()}")
+                    send_images, send_videos = plan.images, plan.video_links
+                    # Videos stepped down the ladder to fit are fetched under their own rung keys
+                    content_keys.update(plan.content_keys)
+                    video_fallbacks.update(plan.video_fallbacks)
+                    logger.info(
+                        f"Ready to send media: {len(send_images)} images, {len(send_videos)} videos"
                     )
-                    if info_image_url:
-                        yield event.image_result(info_image_url)
-                    elif render_mode == "image":
-                        logger.warning(
-                            "Douyin info image render failed, falling back to text mode"
+                    if send_images or send_videos:
+                        media_task = asyncio.create_task(
+                            self._send_media_async(
+                                event,
+                                dy_downloader,
+                                send_images,
+                                send_videos,
+                                media_bytes_cache,
+                                content_keys,
+                                send_gate=card_sent,
+                                admission=admission,
+                                video_fallbacks=video_fallbacks,
+                            )
                         )
-                        nodes = self._build_douyin_info_nodes(result, uin, name)
-                        yield event.chain_result([Comp.Nodes(nodes=nodes)])
+                    else:
+                        logger.warning("No media file available to send")
 
-                if render_mode in {"text", "both"}:
-                    nodes = self._build_douyin_info_nodes(result, uin, name)
-                    yield event.chain_result([Comp.Nodes(nodes=nodes)])
-
-                # Duration limit check
-                duration_seconds = result.get("duration_seconds", 0)
-                if duration_seconds > 0:
-                    if self.cfg.max_duration and duration_seconds > self.cfg.max_duration:
-                        max_minutes = self.cfg.max_duration / 60
-                        actual_minutes = duration_seconds / 60
-                        warning_msg = (
-                            f"Video duration {actual_minutes:.1f} min exceeds limit "
-                            f"{max_minutes:.1f} min. Skip video download."
+                try:
+                    # Info render mode: text / image / both
+                    render_mode = self.cfg.douyin_info_render_mode
+                    if render_mode in {"image", "both"}:
+                        info_image_url = await self._render_douyin_info_image(
+                            result=result,
+                            image_count=len(images),
+                            video_count=len(video_links),
+                            dy_downloader=dy_downloader,
+                            media_bytes_cache=media_bytes_cache,
+                            content_keys=content_keys,
                         )
-                        logger.warning(warning_msg)
-                        if self.cfg.show_download_fail_tip:
-                            yield event.plain_result(warning_msg)
-                        return
+                        if info_image_url:
+                            yield event.image_result(info_image_url)
+                        elif render_mode == "image":
+                            logger.warning(
+                                "Douyin info image render failed, falling back to text mode"
+                            )
+                            nodes = self._build_douyin_info_nodes(result, uin, name)
+                            yield event.chain_result([Comp.Nodes(nodes=nodes)])
 
-                logger.info(
-                    f"Ready to send media: {len(images)} images, {len(video_links)} videos"
-                )
+                    if render_mode in {"text", "both"}:
+                        nodes = self._build_douyin_info_nodes(result, uin, name)
+                        yield event.chain_result([Comp.Nodes(nodes=nodes)])
 
-                if images or video_links:
-                    await self._send_media_async(
-                        event, dy_downloader, images, video_links, media_bytes_cache
-                    )
-                else:
-                    logger.warning("No media file available to send")
+                    card_sent.set()
+                    if warning_msg and self.cfg.show_download_fail_tip:
+                        yield event.plain_result(warning_msg)
+                    if media_task is not None:
+                        await media_task
+                    if plan is not None and plan.links and self.cfg.show_download_fail_tip:
+                        # Assets left out of the plan degrade to links
+                        lines = [
+                            f"{a.role} {a.index + 1} ({a.reason}): {a.url}" for a in plan.links
+                        ]
+                        yield event.plain_result("Not downloaded, open directly:\n" + "\n".join(lines))
+                finally:
+                    # Any failure (or the consumer closing us) cancels in-flight downloads;
+                    # the pipeline releases leases and temp files on cancellation.
+                    if media_task is not None and not media_task.done():
+                        media_task.cancel()
+                        await asyncio.gather(media_task, return_exceptions=True)
 
             finally:
                 await dy_downloader.close()
@@ -517,6 +710,70 @@ class MediaParserPlugin(Star):
             if self.cfg.show_download_fail_tip:
                 yield event.plain_result(f"Parse failed: {str(e)}")
 
+    async def _admit_douyin_media(
+        self,
+        dy_downloader: AsyncDouyinDownloader,
+        result: Dict[str, Any],
+        images: List[str],
+        video_links: List[str],
+        video_fallbacks: Dict[str, List[Dict[str, Any]]],
+    ) -> AdmissionResult:
+        """Run the admission stage right after detail extraction.
+
+        A video whose selected rung is rejected gets its lower rungs probed in order.
+        """
+        admission = MediaAdmission(
+            max_size=self.cfg.max_size,
+            max_duration=self.cfg.max_duration,
+            probe_timeout=min(self.cfg.common_timeout, 5),
+        )
+        started = asyncio.get_running_loop().time()
+        decision = await admission.check(
+            result,
+            images,
+            video_links,
+            dy_downloader.probe_media,
+            fallbacks={u: [r["url"] for r in rungs] for u, rungs in video_fallbacks.items()},
+        )
+        logger.info(
+            f"Admission: {decision.summary()} "
+            f"({(asyncio.get_running_loop().time() - started) * 1000:.0f}ms)"
+        )
+        return decision
+
+    def _new_douyin_downloader(self, use_detail_cache: bool = True) -> AsyncDouyinDownloader:
+        """Create a per-request downloader on top of the shared pools."""
+        return AsyncDouyinDownloader(
+            enable_cf_proxy=self.cfg.enable_cf_proxy,
+            cf_proxy_url=self.cfg.cf_proxy_url,
+            download_retry_times=self.cfg.download_retry_times,
+            download_timeout=self.cfg.download_timeout,
+            common_timeout=self.cfg.common_timeout,
+            max_size=self.cfg.max_size,
+            max_duration=self.cfg.max_duration,
+            token_store=self.dy_token_store,
+            http_pool=self.http_pool,
+            detail_cache=self.detail_cache if use_detail_cache else None,
+            link_cache=self.link_cache,
+            singleflight=self.singleflight,
+        )
+
+    async def _refresh_douyin_detail(self, aweme_id: str) -> Optional[Dict[str, Any]]:
+        """Background refresher for stale detail cache entries."""
+        dy_downloader = self._new_douyin_downloader(use_detail_cache=False)
+        try:
+            return await dy_downloader.get_detail_by_id(aweme_id)
+        finally:
+            await dy_downloader.close()
+
+    def _under_data_dir(self, path: str) -> bool:
+        """Whether path resolves inside the plugin data dir (symlinks followed)."""
+        data_dir = os.path.realpath(self._data_dir)
+        try:
+            return os.path.commonpath([data_dir, os.path.realpath(path)]) == data_dir
+        except ValueError:
+            return False
+
     @staticmethod
     def _count_cjk(text: str) -> int:
         return len(re.findall(r"[\u4e00-\u9fff]", text))
@@ -706,7 +963,8 @@ class MediaParserPlugin(Star):
             if MediaParserPlugin._is_http_url(item):
                 return item
             if isinstance(item, dict):
-                for key in ("cover", "image"):
+                keys = ("url",) if item.get("type") == "image" else ("cover", "image")
+                for key in keys:
                     value = item.get(key)
                     if MediaParserPlugin._is_http_url(value):
                         return value
@@ -721,7 +979,11 @@ class MediaParserPlugin(Star):
                 if self._is_http_url(item):
                     images.append(item)
             elif isinstance(item, dict):
-                if item.get("type") == "video":
+                if item.get("type") == "image":
+                    image_url = item.get("url")
+                    if self._is_http_url(image_url):
+                        images.append(image_url)
+                elif item.get("type") == "video":
                     cover = item.get("cover")
                     video_url = item.get("url")
                     if self._is_http_url(cover):
@@ -738,6 +1000,63 @@ class MediaParserPlugin(Star):
 
         return images, video_links
 
+    @staticmethod
+    def _collect_content_keys(downloads: List[Any]) -> Dict[str, str]:
+        """Map each signed download URL to the extractor's stable content key."""
+        pairs = {
+            "image": (("url", "key"),),
+            "video": (("url", "key"), ("cover", "cover_key")),
+            "live_photo": (("image", "image_key"), ("video", "video_key")),
+        }
+        content_keys: Dict[str, str] = {}
+        for item in downloads:
+            if not isinstance(item, dict):
+                continue
+            for url_field, key_field in pairs.get(item.get("type"), ()):
+                url, key = item.get(url_field), item.get(key_field)
+                if url and key:
+                    content_keys[url] = key
+        return content_keys
+
+    @staticmethod
+    def _collect_video_fallbacks(downloads: List[Any]) -> Dict[str, List[Dict[str, Any]]]:
+        """Map each selected video URL to the lower ladder rungs to try if it fails."""
+        fields = {"video": ("url", "fallbacks"), "live_photo": ("video", "video_fallbacks")}
+        fallbacks: Dict[str, List[Dict[str, Any]]] = {}
+        for item in downloads:
+            if not isinstance(item, dict) or item.get("type") not in fields:
+                continue
+            url_field, fallback_field = fields[item["type"]]
+            url, rungs = item.get(url_field), item.get(fallback_field)
+            if url and rungs:
+                fallbacks[url] = rungs
+        return fallbacks
+
+    @staticmethod
+    def _adopt_admitted_rungs(downloads: List[Any], admission: AdmissionResult) -> List[Any]:
+        """Swap rejected videos for the lower rung that passed admission.
+
+        Returns a new list; the entries may belong to the shared detail cache.
+        """
+        fields = {
+            "video": ("url", "key", "fallbacks"),
+            "live_photo": ("video", "video_key", "video_fallbacks"),
+        }
+        adopted = []
+        for item in downloads:
+            if isinstance(item, dict) and item.get("type") in fields:
+                url_field, key_field, fallback_field = fields[item["type"]]
+                substitute = admission.substitutes.get(item.get(url_field))
+                rungs = item.get(fallback_field) or []
+                for i, rung in enumerate(rungs):
+                    if substitute and rung.get("url") == substitute:
+                        item = dict(item)
+                        item[url_field], item[key_field] = rung["url"], rung.get("key")
+                        item[fallback_field] = rungs[i + 1:]
+                        break
+            adopted.append(item)
+        return adopted
+
     def _build_douyin_info_nodes(self, result: Dict[str, Any], uin: str, name: str) -> List[Any]:
         nodes = []
 
@@ -783,6 +1102,7 @@ class MediaParserPlugin(Star):
         video_count: int,
         dy_downloader: AsyncDouyinDownloader,
         media_bytes_cache: Optional[Dict[str, bytes]] = None,
+        content_keys: Optional[Dict[str, str]] = None,
     ) -> Optional[str]:
         try:
             author = result.get("author") or {}
@@ -793,21 +1113,19 @@ class MediaParserPlugin(Star):
                 desc = desc[:77] + "..."
 
             cover_source_url = self._pick_cover_url(result.get("downloads", []))
-            cover_url = await self._to_data_url_if_possible(
-                dy_downloader,
-                cover_source_url,
-                media_bytes_cache,
-            )
-            author_avatar = await self._to_data_url_if_possible(
-                dy_downloader,
-                self._normalize_text(author.get("avatar"), ""),
-                media_bytes_cache,
-            )
-            music_cover = await self._to_data_url_if_possible(
+            assets = await self._fetch_card_assets(
                 dy_downloader,
-                self._normalize_text(music.get("cover"), ""),
+                {
+                    "cover": cover_source_url,
+                    "avatar": self._normalize_text(author.get("avatar"), ""),
+                    "music_cover": self._normalize_text(music.get("cover"), ""),
+                },
                 media_bytes_cache,
+                content_keys,
             )
+            cover_url = assets["cover"]
+            author_avatar = assets["avatar"]
+            music_cover = assets["music_cover"]
             cover_raw = (
                 media_bytes_cache.get(cover_source_url, b"")
                 if media_bytes_cache and cover_source_url
@@ -879,11 +1197,47 @@ class MediaParserPlugin(Star):
             logger.error(f"Douyin info image render failed: {e}")
             return None
 
+    async def _fetch_card_assets(
+        self,
+        dy_downloader: AsyncDouyinDownloader,
+        sources: Dict[str, str],
+        media_bytes_cache: Optional[Dict[str, bytes]] = None,
+        content_keys: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, str]:
+        """Fetch card assets concurrently, each under its own deadline.
+
+        An asset that misses its deadline is left empty so the card renders without it.
+        Only the cover bytes are kept in media_bytes_cache (the card sizes itself from them).
+        """
+        budget = self.cfg.card_asset_timeout
+
+        async def fetch(name: str, url: str) -> str:
+            timeout = budget * CARD_ASSET_BUDGETS.get(name, 1.0)
+            try:
+                return await asyncio.wait_for(
+                    self._to_data_url_if_possible(
+                        dy_downloader,
+                        url,
+                        media_bytes_cache if name == "cover" else None,
+                        content_keys,
+                    ),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                metrics.incr("card.asset_timeout")
+                logger.warning(f"Card asset {name} missed its {timeout:.1f}s deadline, skipped")
+                return ""
+
+        names = list(sources)
+        values = await asyncio.gather(*(fetch(name, sources[name]) for name in names))
+        return dict(zip(names, values))
+
     async def _to_data_url_if_possible(
         self,
         dy_downloader: AsyncDouyinDownloader,
         source_url: str,
         media_bytes_cache: Optional[Dict[str, bytes]] = None,
+        content_keys: Optional[Dict[str, str]] = None,
     ) -> str:
         if not self._is_http_url(source_url):
             return source_url
@@ -895,15 +1249,16 @@ class MediaParserPlugin(Star):
                 base64_str = base64.b64encode(cached_bytes).decode("ascii")
                 return f"data:{mime};base64,{base64_str}"
 
-        temp_path = None
+        lease = None
         try:
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-            temp_path = temp_file.name
-            temp_file.close()
-
-            success = await dy_downloader.download_video(source_url, temp_path)
-            if success and os.path.exists(temp_path) and os.path.getsize(temp_path) > 0:
-                with open(temp_path, "rb") as f:
+            lease = await self._download_shared(
+                dy_downloader,
+                source_url,
+                ".jpg",
+                (content_keys or {}).get(source_url),
+            )
+            if lease:
+                with open(lease.path, "rb") as f:
                     raw = f.read()
                 if media_bytes_cache is not None:
                     media_bytes_cache[source_url] = raw
@@ -913,14 +1268,64 @@ class MediaParserPlugin(Star):
         except Exception as e:
             logger.debug(f"Failed to convert resource to data URL, fallback URL: {source_url}, error: {e}")
         finally:
-            if temp_path and os.path.exists(temp_path):
-                try:
-                    os.unlink(temp_path)
-                except Exception:
-                    pass
+            if lease:
+                lease.release()
 
         return source_url
 
+    async def _download_shared(
+        self,
+        dy_downloader: AsyncDouyinDownloader,
+        url: str,
+        suffix: str,
+        content_key: Optional[str] = None,
+    ) -> Optional[DownloadLease]:
+        """Download through the shared registry so concurrent requests fetch once.
+
+        Keyed by the stable content key when known, since signed URLs differ per API call.
+        Assets with a content key are served from / published to the disk media cache.
+        With a shared state backend, only the instance holding the download lease fetches
+        the asset; the others pick it up from the shared media cache once published.
+        """
+
+        async def download(path: str, force_publish: bool = False) -> bool:
+            started = time.monotonic()
+            # Only video downloads count as occupied slots; images finish too fast to matter
+            tracked = suffix == ".mp4"
+            if tracked:
+                self.quality.download_started()
+            try:
+                # Runs in the registry's shared task: other requests may still be waiting
+                # on it after the requester that started it closes its downloader
+                with dy_downloader.shared():
+                    success = await dy_downloader.download_video(url, path)
+            finally:
+                if tracked:
+                    self.quality.download_finished()
+            if success:
+                self.quality.record_download(os.path.getsize(path), time.monotonic() - started)
+                await self.media_cache.publish(content_key, path, force=force_publish)
+            return success
+
+        async def fetch(path: str) -> bool:
+            if await self.media_cache.checkout(content_key, path):
+                logger.info(f"Media cache hit: {content_key}")
+                return True
+            if self.download_leases is None or not content_key:
+                return await download(path)
+            return await self.download_leases.run_once(
+                content_key,
+                produce=lambda: download(path, force_publish=True),
+                consume=lambda: self.media_cache.checkout(content_key, path, record=False),
+                timeout=self.cfg.download_timeout,
+            )
+
+        return await self.download_registry.acquire(
+            content_key or normalize_url(url),
+            fetch,
+            suffix=suffix,
+        )
+
     def _build_local_font_urls(self) -> Dict[str, str]:
         base_dir = os.path.dirname(os.path.abspath(__file__))
         font_dir = os.path.join(base_dir, "fonts")
@@ -1159,112 +1564,196 @@ class MediaParserPlugin(Star):
         images,
         video_links,
         media_bytes_cache: Optional[Dict[str, bytes]] = None,
+        content_keys: Optional[Dict[str, str]] = None,
+        send_gate: Optional[asyncio.Event] = None,
+        admission: Optional[AdmissionResult] = None,
+        video_fallbacks: Optional[Dict[str, List[Dict[str, Any]]]] = None,
     ):
-        """Download and send media files asynchronously."""
+        """Download and send media files asynchronously.
+
+        Downloads run ahead through an ordered pipeline (bounded concurrency and
+        look-ahead window); sends still go out in the original order, and not
+        before send_gate is set when one is given. Assets rejected at admission
+        are not downloaded and are sent as links. A video that fails to download
+        falls back through its lower bitrate rungs from video_fallbacks.
+        """
+        content_keys = content_keys or {}
+        video_fallbacks = video_fallbacks or {}
+        # Under load, start this many rungs below the selected bitrate
+        tier = self.quality.update()
         logger.info(
             f"Start sending media files: {len(images)} images, {len(video_links)} videos"
         )
-
-        # Download images
-        for i, img_url in enumerate(images):
-            temp_path = None
+        items = [("image", i, url) for i, url in enumerate(images)] + [
+            ("video", i, url) for i, url in enumerate(video_links)
+        ]
+        totals = {"image": len(images), "video": len(video_links)}
+
+        async def prepare(_, item) -> Dict[str, Any]:
+            kind, i, url = item
+            if admission is not None and not admission.allows(url):
+                return {"path": None, "lease": None, "rejected": admission.rejected.get(url)}
+            logger.info(f"Downloading {kind} {i+1}/{totals[kind]}")
+            if kind == "image":
+                return await self._prepare_image(
+                    dy_downloader, url, media_bytes_cache, content_keys
+                )
+            rungs = [{"url": url, "key": content_keys.get(url)}] + video_fallbacks.get(url, [])
+            if tier and len(rungs) > 1:
+                skipped = min(tier, len(rungs) - 1)
+                logger.info(f"Video {i+1}: quality tier {tier}, skipping {skipped} higher bitrate rung(s)")
+                rungs = rungs[skipped:]
+            for rung, rung_info in enumerate(rungs):
+                if rung:
+                    logger.warning(
+                        f"Video {i+1} download failed, falling back to bitrate rung {rung + 1}/{len(rungs)}"
+                    )
+                    metrics.incr("download.ladder_fallback")
+                lease = await self._download_shared(
+                    dy_downloader, rung_info["url"], ".mp4", rung_info.get("key")
+                )
+                if lease:
+                    return {"path": lease.path, "lease": lease}
+            return {"path": None, "lease": None}
+
+        async def deliver(_, item, prepared: Optional[Dict[str, Any]]):
+            kind, i, url = item
+            if send_gate is not None:
+                await send_gate.wait()
             try:
-                logger.info(f"Downloading image {i+1}/{len(images)}")
+                if kind == "image":
+                    await self._deliver_image(event, i, url, prepared)
+                else:
+                    await self._deliver_video(event, i, url, prepared)
+            except Exception as e:
+                logger.error(f"{kind.capitalize()} {i+1} processing error: {e}")
+
+        pipeline = OrderedPipeline(
+            concurrency=self.cfg.download_concurrency,
+            window=self.cfg.download_lookahead,
+        )
+        await pipeline.run(items, prepare, deliver, release=self._release_prepared)
 
+    async def _prepare_image(
+        self,
+        dy_downloader,
+        img_url: str,
+        media_bytes_cache: Optional[Dict[str, bytes]],
+        content_keys: Dict[str, str],
+    ) -> Dict[str, Any]:
+        prepared: Dict[str, Any] = {"path": None, "lease": None, "temp_path": None}
+        # Reuse cache first to avoid duplicate downloads.
+        if media_bytes_cache and img_url in media_bytes_cache:
+            raw = media_bytes_cache.get(img_url, b"")
+            if raw:
                 temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-                temp_path = temp_file.name
+                prepared["temp_path"] = temp_file.name
+                temp_file.write(raw)
                 temp_file.close()
+                prepared["path"] = temp_file.name
+                return prepared
 
-                success = False
-                # Reuse cache first to avoid duplicate downloads.
-                if media_bytes_cache and img_url in media_bytes_cache:
-                    raw = media_bytes_cache.get(img_url, b"")
-                    if raw:
-                        with open(temp_path, "wb") as f:
-                            f.write(raw)
-                        success = True
-
-                if not success:
-                    success = await dy_downloader.download_video(img_url, temp_path)
-                    if (
-                        success
-                        and media_bytes_cache is not None
-                        and os.path.exists(temp_path)
-                        and os.path.getsize(temp_path) > 0
-                    ):
-                        try:
-                            with open(temp_path, "rb") as f:
-                                media_bytes_cache[img_url] = f.read()
-                        except Exception:
-                            pass
-
-                await asyncio.sleep(2)
-
-                if success and os.path.exists(temp_path) and os.path.getsize(temp_path) > 0:
-                    result = event.make_result()
-                    result.chain = [Comp.Image.fromFileSystem(temp_path)]
-                    await event.send(result)
-                    logger.info(f"Image {i+1} sent successfully")
-                else:
-                    if self.cfg.show_download_fail_tip:
-                        await event.send(event.plain_result(f"Image download failed: {img_url}"))
-                    logger.warning(f"Image {i+1} download failed")
-
-            except Exception as e:
-                logger.error(f"Image {i+1} processing error: {e}")
-            finally:
-                if temp_path and os.path.exists(temp_path):
-                    try:
-                        os.unlink(temp_path)
-                    except Exception as e:
-                        logger.warning(f"Failed to cleanup temp file: {temp_path}, {e}")
-
-        # Download videos
-        for i, video_url in enumerate(video_links):
-            temp_path = None
-            try:
-                logger.info(f"Downloading video {i+1}/{len(video_links)}")
+        # Not copied into media_bytes_cache: the pipeline prepares images ahead, and the card
+        # fetches its cover through the same download registry entry anyway
+        lease = await self._download_shared(
+            dy_downloader, img_url, ".jpg", content_keys.get(img_url)
+        )
+        if lease:
+            prepared["lease"] = lease
+            prepared["path"] = lease.path
+        return prepared
+
+    async def _deliver_image(self, event, i: int, img_url: str, prepared):
+        if prepared and prepared.get("rejected"):
+            logger.warning(f"Image {i+1} skipped: {prepared['rejected']}")
+            if self.cfg.show_download_fail_tip:
+                await self._paced_send(
+                    event, event.plain_result(f"Image skipped ({prepared['rejected']}): {img_url}")
+                )
+            return
+        send_path = prepared.get("path") if prepared else None
 
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-                temp_path = temp_file.name
-                temp_file.close()
+        if send_path and os.path.exists(send_path) and os.path.getsize(send_path) > 0:
+            result = event.make_result()
+            result.chain = [Comp.Image.fromFileSystem(send_path)]
+            await self._paced_send(event, result, os.path.getsize(send_path))
+            logger.info(f"Image {i+1} sent successfully")
+        else:
+            if self.cfg.show_download_fail_tip:
+                await self._paced_send(
+                    event, event.plain_result(f"Image download failed: {img_url}")
+                )
+            logger.warning(f"Image {i+1} download failed")
 
-                success = await dy_downloader.download_video(video_url, temp_path)
+    async def _deliver_video(self, event, i: int, video_url: str, prepared):
+        if prepared and prepared.get("rejected"):
+            logger.warning(f"Video {i+1} skipped: {prepared['rejected']}")
+            if self.cfg.show_download_fail_tip:
+                await self._paced_send(
+                    event, event.plain_result(f"Video skipped ({prepared['rejected']}): {video_url}")
+                )
+            return
+        lease = prepared.get("lease") if prepared else None
+
+        # Video file should be at least 10KB.
+        min_video_size = 10 * 1024
+        if lease:
+            file_size = lease.size
+            if file_size >= min_video_size:
+                result = event.make_result()
+                result.chain = [Comp.Video.fromFileSystem(lease.path)]
+                await self._paced_send(event, result, file_size)
+                logger.info(f"Video {i+1} sent successfully, size: {file_size} bytes")
+            else:
+                logger.warning(
+                    f"Video {i+1} file too small ({file_size} bytes), skip sending"
+                )
+                if self.cfg.show_download_fail_tip:
+                    await self._paced_send(
+                        event,
+                        event.plain_result(
+                            "Video download incomplete, open original link directly."
+                        ),
+                    )
+        else:
+            if self.cfg.show_download_fail_tip:
+                await self._paced_send(event, event.plain_result(f"Video link: {video_url}"))
+            logger.warning(f"Video {i+1} download failed")
 
-                await asyncio.sleep(3)
+    async def _paced_send(self, event, result, size: int = 0, retries: int = 1):
+        """Send through the per-chat pacer.
 
-                # Video file should be at least 10KB.
-                min_video_size = 10 * 1024
-                if success and os.path.exists(temp_path):
-                    file_size = os.path.getsize(temp_path)
-                    if file_size >= min_video_size:
-                        result = event.make_result()
-                        result.chain = [Comp.Video.fromFileSystem(temp_path)]
-                        await event.send(result)
-                        logger.info(f"Video {i+1} sent successfully, size: {file_size} bytes")
-                    else:
-                        logger.warning(
-                            f"Video {i+1} file too small ({file_size} bytes), skip sending"
-                        )
-                        if self.cfg.show_download_fail_tip:
-                            await event.send(
-                                event.plain_result(
-                                    "Video download incomplete, open original link directly."
-                                )
-                            )
-                else:
-                    if self.cfg.show_download_fail_tip:
-                        await event.send(event.plain_result(f"Video link: {video_url}"))
-                    logger.warning(f"Video {i+1} download failed")
+        A failed send backs the chat off; only a throttled send (rate-limit code or
+        retry-after hint) is retried, other errors are re-raised right away.
+        """
+        platform = event.get_platform_name()
+        origin = event.unified_msg_origin
+        for attempt in range(retries + 1):
+            await self.send_pacer.acquire(platform, origin, send_cost(size))
+            try:
+                await event.send(result)
+            except Exception as e:
+                throttled, retry_after = throttle_info(e)
+                self.send_pacer.report(platform, origin, False, retry_after)
+                if not throttled or attempt >= retries:
+                    raise
+                metrics.incr("send.throttle_retry")
+                continue
+            self.send_pacer.report(platform, origin, True)
+            return
 
+    @staticmethod
+    def _release_prepared(prepared: Dict[str, Any]):
+        """Release the download lease / temp file held by a prepared media item."""
+        lease = prepared.get("lease")
+        if lease:
+            lease.release()
+        temp_path = prepared.get("temp_path")
+        if temp_path and os.path.exists(temp_path):
+            try:
+                os.unlink(temp_path)
             except Exception as e:
-                logger.error(f"Video {i+1} processing error: {e}")
-            finally:
-                if temp_path and os.path.exists(temp_path):
-                    try:
-                        os.unlink(temp_path)
-                    except Exception as e:
-                        logger.warning(f"Failed to cleanup temp file: {temp_path}, {e}")
+                logger.warning(f"Failed to cleanup temp file: {temp_path}, {e}")
 
     async def parse_xiaohongshu(self, event: AstrMessageEvent, url: str):
         """Parse Xiaohongshu link asynchronously."""
@@ -1309,7 +1798,12 @@ class MediaParserPlugin(Star):
                     yield event.chain_result([Comp.Image.fromURL(img_url)])
 
             if result.get("videos"):
+                fallbacks = result.get("videoFallbacks") or {}
                 for video_url in result["videos"]:
+                    # Fall back to the stream's backup URLs when the selected one is unreachable
+                    video_url = await self.xhs_parser.pick_reachable(
+                        [video_url] + fallbacks.get(video_url, [])
+                    )
                     yield event.chain_result([Comp.Video.fromURL(video_url)])
 
         except Exception as e:
@@ -1352,6 +1846,14 @@ class MediaParserPlugin(Star):
         is_enabled = self.cfg.is_session_enabled(
             umo, event.is_admin(), event.is_at_or_wake_command
         )
+        pool_stats = self.dy_token_store.stats()
+        http_stats = self.http_pool.stats()
+        detail_stats = self.detail_cache.stats()
+        link_stats = self.link_cache.stats()
+        media_stats = self.media_cache.stats()
+        pacer_stats = self.send_pacer.stats()
+        queue_stats = self.send_queue.stats()
+        quality_stats = self.quality.stats()
 
         status_text = (
             "媒体解析插件状态\n\n"
@@ -1362,6 +1864,44 @@ class MediaParserPlugin(Star):
             f"最大视频时长: {self.cfg.source_max_minute}分钟\n"
             f"抖音信息渲染模式: {self.cfg.douyin_info_render_mode}\n"
             f"下载重试次数: {self.cfg.download_retry_times}\n"
-            f"CF 代理: {'已启用' if self.cfg.enable_cf_proxy else '未启用'}"
+            f"CF 代理: {'已启用' if self.cfg.enable_cf_proxy else '未启用'}\n"
+            f"共享状态后端: {self.state_backend.name if self.state_backend else '未启用'}\n"
+            f"抖音身份池: {pool_stats['ready']}/{pool_stats['size']} 可用, "
+            f"{pool_stats['in_use']} 使用中\n"
+            f"连接复用: {http_stats['reused']}/{http_stats['created'] + http_stats['reused']} "
+            f"({http_stats['reuse_ratio']:.0%}), DNS 缓存命中 {http_stats['dns_hit']}\n"
+            f"详情缓存: {detail_stats['entries']} 条, 命中 {detail_stats['hit']}, "
+            f"旧数据 {detail_stats['stale']}, 未命中 {detail_stats['miss']} "
+            f"({detail_stats['hit_ratio']:.0%}), 来自其他实例 {detail_stats['shared_hit']}\n"
+            f"短链接缓存: {link_stats['entries']} 条, 命中 {link_stats['hit']}, 未命中 {link_stats['miss']}, "
+            f"来自其他实例 {link_stats['shared_hit']}\n"
+            f"短链接跳转: 平均 {metrics.mean('resolve.hops'):.1f} 跳, "
+            f"提前停止 {int(metrics.get('resolve.early_stop'))} 次 "
+            f"(提前停止率 {metrics.mean('resolve.early_stop_rate'):.0%}, "
+            f"按跳数上限估算平均每次节省 {metrics.mean('resolve.hops_saved'):.2f} 跳)\n"
+            f"并发合并: {int(metrics.get('singleflight.shared'))} 次复用进行中的解析, "
+            f"{int(metrics.get('download.shared'))} 次复用进行中的下载, "
+            f"{int(metrics.get('lease.shared'))} 次复用其他实例的下载\n"
+            f"媒体缓存: {media_stats['entries']} 个文件, "
+            f"{media_stats['bytes'] / 1024 / 1024:.1f}/{media_stats['max_bytes'] / 1024 / 1024:.0f}MB, "
+            f"命中率 {media_stats['hit_ratio']:.0%}, "
+            f"节省下载 {media_stats['bytes_saved'] / 1024 / 1024:.1f}MB\n"
+            f"准入拒绝: {int(metrics.get('admission.asset_rejected'))} 个文件, "
+            f"{int(metrics.get('admission.duration_rejected'))} 条超时长, "
+            f"{int(metrics.get('admission.rung_fallback'))} 个视频改用低码率通过\n"
+            f"字节预算: {int(metrics.get('planner.downgraded'))} 个视频降码率, "
+            f"{int(metrics.get('planner.degraded'))} 个文件超预算退化为链接\n"
+            f"视频码率: 画质档位 {quality_stats['tier']}/{quality_stats['max_tier']} (0 为最高), "
+            f"进行中下载 {quality_stats['active']}/{quality_stats['slots']}, "
+            f"下载平均 {quality_stats['latency']:.1f}s / 目标 {self.cfg.download_latency_target}s, "
+            f"吞吐 {quality_stats['throughput'] / 1024 / 1024:.1f}MB/s, "
+            f"降档 {int(metrics.get('quality.downgrade'))} 次, "
+            f"下载失败回退低码率 {int(metrics.get('download.ladder_fallback'))} 次\n"
+            f"发送节流: {pacer_stats['chats']} 个会话, {pacer_stats['throttled']} 个降速中, "
+            f"平均等待 {metrics.mean('pacer.wait_ms'):.0f}ms, "
+            f"退避 {int(metrics.get('pacer.backoff'))} 次\n"
+            f"发送队列: {queue_stats['busy']}/{queue_stats['workers']} 个 worker 忙, "
+            f"{queue_stats['pending']} 条排队 (单会话最多 {queue_stats['max_depth']}), "
+            f"平均排队 {metrics.mean('send_queue.wait_ms'):.0f}ms"
         )
         yield event.plain_result(status_text)
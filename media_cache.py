@@ -0,0 +1,208 @@
+"""
+按内容 key 寻址的本地媒体磁盘缓存
+热门视频被多个群反复转发时直接复用已下载的文件：总容量上限 + TinyLFU 准入与按大小淘汰，
+写入时先落临时文件再 rename 原子发布，取出时用硬链接交给发送方（跨设备时回退为复制）。
+缓存目录可由多个实例共用：本进程索引中没有、但目录里已有其他实例发布的文件时直接接管
+"""
+import os
+import time
+import shutil
+import asyncio
+import hashlib
+from typing import Dict, Optional
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+    from .cache_core import TinyLFUCache, TraceRecorder
+except ImportError:
+    from metrics import metrics
+    from cache_core import TinyLFUCache, TraceRecorder
+
+
+class MediaCache:
+    """内容寻址的媒体文件缓存"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 1024 * 1024 * 1024,
+        trace: Optional[TraceRecorder] = None,
+    ):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总字节数上限，0 表示禁用
+            trace: 访问日志记录器，供 cache_sim.py 回放
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.trace = trace
+        # {文件名: 字节数}；只出现一次的大文件不会挤掉反复被转发的热门文件
+        self._index = TinyLFUCache(
+            max_bytes, expected_entries=4096, on_evict=self._on_evict
+        )
+        if self.enabled:
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    async def checkout(self, key: Optional[str], dest_path: str, record: bool = True) -> bool:
+        """命中时把缓存文件链接到 dest_path（覆盖已有文件）
+
+        record=False 用于轮询等待其他实例发布，不计入命中统计和访问频率
+        """
+        if not self.enabled or not key:
+            return False
+        name = self._name(key)
+        # 未命中也计入访问频率
+        size = self._index.get(name) if record else self._index.peek(name)
+        if size is None:
+            size = self._adopt(name)
+        if size is None:
+            if record:
+                metrics.incr("media_cache.miss")
+            return False
+        try:
+            await asyncio.to_thread(self._link_or_copy, self._path(name), dest_path)
+        except Exception as e:
+            logger.warning(f"[media_cache] 取出缓存失败，按未命中处理: {e}")
+            self._drop(name)
+            if record:
+                metrics.incr("media_cache.miss")
+            return False
+
+        try:
+            os.utime(self._path(name))
+        except OSError:
+            pass
+        if not record:
+            return True
+        metrics.incr("media_cache.hit")
+        if self.trace:
+            self.trace.record(f"media:{name}", size)
+        metrics.incr("media_cache.bytes_saved", size)
+        return True
+
+    async def publish(self, key: Optional[str], src_path: str, force: bool = False) -> bool:
+        """把下载完成的文件原子地放入缓存
+
+        force=True 时跳过频率准入（其他实例正在等待这个文件）
+        """
+        if not self.enabled or not key or not os.path.exists(src_path):
+            return False
+        size = os.path.getsize(src_path)
+        if size <= 0 or size > self.max_bytes:
+            return False
+        name = self._name(key)
+        if self.trace:
+            self.trace.record(f"media:{name}", size)
+        if name in self._index:
+            return True
+        # 先按频率判断是否准入，冷门文件不占用写入开销
+        if force:
+            self._index.load(name, size, size)
+        elif not self._index.put(name, size, size):
+            metrics.incr("media_cache.rejected")
+            return False
+
+        tmp_path = f"{self._path(name)}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            await asyncio.to_thread(self._link_or_copy, src_path, tmp_path)
+            os.replace(tmp_path, self._path(name))
+        except Exception as e:
+            logger.warning(f"[media_cache] 写入缓存失败: {e}")
+            self._remove_file(tmp_path)
+            self._index.pop(name)
+            return False
+        if name not in self._index:
+            # 写入期间已被其他文件挤出
+            self._remove_file(self._path(name))
+            return False
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        hit = int(metrics.get("media_cache.hit"))
+        miss = int(metrics.get("media_cache.miss"))
+        return {
+            "entries": len(self._index),
+            "bytes": self._index.weight,
+            "max_bytes": self.max_bytes,
+            "hit": hit,
+            "miss": miss,
+            "hit_ratio": hit / (hit + miss) if hit + miss else 0.0,
+            "bytes_saved": int(metrics.get("media_cache.bytes_saved")),
+        }
+
+    def _adopt(self, name: str) -> Optional[int]:
+        """接管其他实例发布到共享目录中的文件"""
+        try:
+            size = os.path.getsize(self._path(name))
+        except OSError:
+            return None
+        if size <= 0:
+            return None
+        self._index.load(name, size, size)
+        metrics.incr("media_cache.adopted")
+        return size
+
+    def _on_evict(self, name: str, size: int):
+        self._remove_file(self._path(name))
+        metrics.incr("media_cache.evict")
+
+    def _drop(self, name: str):
+        self._index.pop(name)
+        self._remove_file(self._path(name))
+
+    def _load_index(self):
+        """启动时按修改时间重建 LRU 顺序，并清理残留的临时文件"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = self._path(name)
+            if name.endswith(".tmp"):
+                self._remove_file(path)
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._index.load(name, size, size)
+        if len(self._index):
+            logger.info(
+                f"[media_cache] 已加载 {len(self._index)} 个缓存文件，"
+                f"共 {self._index.weight / 1024 / 1024:.1f}MB"
+            )
+
+    @staticmethod
+    def _link_or_copy(src: str, dest: str):
+        """优先硬链接（零拷贝），跨设备或不支持时复制"""
+        if os.path.exists(dest):
+            os.unlink(dest)
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            if os.path.exists(path):
+                os.chmod(path, 0o644)
+                os.unlink(path)
+        except Exception as e:
+            logger.warning(f"[media_cache] 删除文件失败: {path}, {e}")
@@ -0,0 +1,92 @@
+"""
+按原顺序发送、并发预取的媒体流水线
+图集/实况图逐张“下载 → 发送”时总耗时是所有下载之和；这里让后续条目的下载提前进行，
+同时下载数受并发上限约束，已下载但未发送的条目数受预取窗口约束（内存/磁盘占用有界），
+发送端始终按原顺序等待下一条就绪
+"""
+import asyncio
+from typing import Awaitable, Callable, Generic, List, Optional, TypeVar
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class OrderedPipeline(Generic[T, R]):
+    """有界并发预取 + 顺序交付"""
+
+    def __init__(self, concurrency: int = 3, window: int = 6):
+        """
+        Args:
+            concurrency: 同时进行的准备（下载）任务数上限
+            window: 从当前待发送条目起最多提前启动多少个条目，不小于 concurrency
+        """
+        self.concurrency = max(1, concurrency)
+        self.window = max(self.concurrency, window)
+
+    async def run(
+        self,
+        items: List[T],
+        prepare: Callable[[int, T], Awaitable[R]],
+        deliver: Callable[[int, T, Optional[R]], Awaitable[None]],
+        release: Optional[Callable[[R], None]] = None,
+    ):
+        """依次交付所有条目
+
+        Args:
+            items: 待处理条目
+            prepare: 准备函数（下载），异常视为结果 None
+            deliver: 交付函数（发送），按 items 顺序调用
+            release: 释放准备结果（交付后或流水线中止时调用）
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+
+        async def guarded(index: int, item: T) -> R:
+            async with semaphore:
+                return await prepare(index, item)
+
+        pending = {}
+        next_start = 0
+        try:
+            for index, item in enumerate(items):
+                while next_start < len(items) and next_start < index + self.window:
+                    pending[next_start] = asyncio.ensure_future(
+                        guarded(next_start, items[next_start])
+                    )
+                    next_start += 1
+
+                task = pending.pop(index)
+                waited_from = loop.time()
+                try:
+                    result = await task
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"[pipeline] 第 {index + 1} 项准备失败: {e}")
+                    result = None
+                metrics.observe("pipeline.wait_ms", (loop.time() - waited_from) * 1000)
+
+                try:
+                    await deliver(index, item, result)
+                finally:
+                    if release is not None and result is not None:
+                        release(result)
+        finally:
+            # 中止时取消未交付的预取任务，并释放已经完成的结果
+            for task in pending.values():
+                task.cancel()
+            if pending:
+                results = await asyncio.gather(*pending.values(), return_exceptions=True)
+                for result in results:
+                    if release is not None and result is not None and not isinstance(
+                        result, BaseException
+                    ):
+                        release(result)
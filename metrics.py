@@ -0,0 +1,45 @@
+"""插件运行指标（进程内计数器）"""
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    """简单的计数器与耗时统计"""
+
+    def __init__(self):
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._observations: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1):
+        """累加计数器"""
+        self._counters[name] += value
+
+    def observe(self, name: str, value: float):
+        """记录一次观测值（次数/总和/最大值）"""
+        obs = self._observations.get(name)
+        if obs is None:
+            obs = self._observations[name] = {"count": 0, "sum": 0.0, "max": 0.0}
+        obs["count"] += 1
+        obs["sum"] += value
+        obs["max"] = max(obs["max"], value)
+
+    def get(self, name: str) -> float:
+        return self._counters.get(name, 0)
+
+    def mean(self, name: str) -> float:
+        obs = self._observations.get(name)
+        if not obs or not obs["count"]:
+            return 0.0
+        return obs["sum"] / obs["count"]
+
+    def snapshot(self) -> Dict[str, float]:
+        data = dict(self._counters)
+        for name, obs in self._observations.items():
+            data[f"{name}.count"] = obs["count"]
+            data[f"{name}.mean"] = obs["sum"] / obs["count"] if obs["count"] else 0.0
+            data[f"{name}.max"] = obs["max"]
+        return data
+
+
+# 插件内共享的指标实例
+metrics = Metrics()
@@ -0,0 +1,125 @@
+"""
+按负载自适应的视频画质档位
+高峰期上行带宽饱和时，每条帖子仍拉取最高码率只会让所有人一起变慢。这里根据近期大文件下载的
+耗时/吞吐与正在进行的下载数判断负载：超出延迟目标或下载槽位占满时逐档降低所选码率，负载回落后逐档恢复
+"""
+import time
+from typing import Dict, Optional
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+class QualityController:
+    """画质档位：0 为大小上限内的最高码率，每升一档在码率阶梯中向下选一级"""
+
+    def __init__(
+        self,
+        latency_target: float = 60,
+        download_slots: int = 12,
+        max_tier: int = 2,
+        step_interval: float = 30,
+        recover_interval: float = 120,
+        min_sample_size: int = 1024 * 1024,
+        enabled: bool = True,
+    ):
+        """
+        Args:
+            latency_target: 单个视频下载耗时目标（秒），近期平均超出时降档
+            download_slots: 下载槽位数（并发下载数 × 发送 worker 数），进行中的视频下载占满时降档
+            max_tier: 最多降几档
+            step_interval: 两次降档之间的最短间隔（秒）
+            recover_interval: 负载回落后保持多久才恢复一档（秒）
+            min_sample_size: 计入统计的最小文件大小（字节），小图片不反映带宽
+            enabled: 关闭时始终使用最高档
+        """
+        self.latency_target = latency_target
+        self.download_slots = max(1, download_slots)
+        self.active = 0  # 进行中的视频下载数
+        self.max_tier = max_tier
+        self.step_interval = step_interval
+        self.recover_interval = recover_interval
+        self.min_sample_size = min_sample_size
+        self.enabled = enabled
+        self.tier = 0
+        self.latency: Optional[float] = None  # 下载耗时 EWMA（秒）
+        self.throughput: Optional[float] = None  # 单个下载吞吐 EWMA（字节/秒）
+        self._alpha = 0.3
+        self._last_sample = 0.0
+        self._last_change = 0.0
+        self._healthy_since: Optional[float] = None
+
+    def download_started(self):
+        self.active += 1
+
+    def download_finished(self):
+        self.active = max(0, self.active - 1)
+
+    def record_download(self, size: int, seconds: float):
+        """记录一次完成的下载"""
+        if size < self.min_sample_size or seconds <= 0:
+            return
+        self.latency = self._ewma(self.latency, seconds)
+        self.throughput = self._ewma(self.throughput, size / seconds)
+        self._last_sample = time.monotonic()
+
+    def update(self) -> int:
+        """根据当前负载调整并返回档位"""
+        if not self.enabled:
+            return 0
+        now = time.monotonic()
+        # 长时间没有新样本时旧的耗时不再代表当前负载
+        latency = self.latency if now - self._last_sample < self.recover_interval else None
+        # 只看实际占用带宽的下载：某个会话排队的帖子多不代表带宽饱和
+        active = self.active
+
+        overloaded = (latency is not None and latency > self.latency_target) or (
+            active >= self.download_slots
+        )
+        healthy = (latency is None or latency < self.latency_target / 2) and (
+            active <= self.download_slots // 2
+        )
+
+        if overloaded:
+            self._healthy_since = None
+            if self.tier < self.max_tier and now - self._last_change >= self.step_interval:
+                self._shift(self.tier + 1, now, latency, active)
+                metrics.incr("quality.downgrade")
+        elif healthy:
+            if self._healthy_since is None:
+                self._healthy_since = now
+            recovered = now - max(self._healthy_since, self._last_change) >= self.recover_interval
+            if self.tier > 0 and recovered:
+                self._shift(self.tier - 1, now, latency, active)
+        else:
+            self._healthy_since = None
+        return self.tier
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "tier": self.tier,
+            "active": self.active,
+            "slots": self.download_slots,
+            "max_tier": self.max_tier,
+            "latency": self.latency or 0.0,
+            "throughput": self.throughput or 0.0,
+        }
+
+    def _shift(self, tier: int, now: float, latency: Optional[float], active: int):
+        latency_text = f"{latency:.1f}s" if latency is not None else "-"
+        logger.info(
+            f"[quality] 画质档位 {self.tier} -> {tier}"
+            f"（下载耗时 {latency_text} / 目标 {self.latency_target:.0f}s，"
+            f"进行中下载 {active}/{self.download_slots}）"
+        )
+        self.tier = tier
+        self._last_change = now
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return current + self._alpha * (value - current)
@@ -0,0 +1,170 @@
+"""
+按平台 + 会话的发送节流
+替代每条消息后固定 sleep 的做法：每个会话一个令牌桶，空闲会话的消息立即发出，
+连续发送时按平台限速平滑；发送失败或被限流时降低速率并暂停一段时间，成功后逐步恢复
+"""
+import re
+import time
+import asyncio
+from typing import Dict, Optional, Tuple
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+# 各平台适配器的单会话限速：(每秒令牌数, 桶容量)
+PLATFORM_LIMITS: Dict[str, Tuple[float, float]] = {
+    "aiocqhttp": (1.0, 3),
+    "qq_official": (0.5, 3),
+    "qq_official_webhook": (0.5, 3),
+    "telegram": (0.33, 3),  # 群组约 20 条/分钟
+    "discord": (1.0, 5),
+    "lark": (1.0, 5),
+    "dingtalk": (0.33, 3),  # 机器人约 20 条/分钟
+    "wecom": (0.33, 3),
+}
+DEFAULT_LIMIT = (0.5, 3)
+
+# 大文件按体积多占用令牌：每多少字节计 1 个令牌
+BYTES_PER_TOKEN = 8 * 1024 * 1024
+
+
+def send_cost(size: int = 0) -> float:
+    """一条消息消耗的令牌数"""
+    return 1.0 + max(0, size) / BYTES_PER_TOKEN
+
+
+# 平台返回的限流错误：HTTP 429 及常见的限流提示文本
+THROTTLE_CODES = {429}
+THROTTLE_PATTERN = re.compile(
+    r"too many requests|rate.?limit|flood|retry after|频率|频繁|过快", re.IGNORECASE
+)
+RETRY_AFTER_PATTERN = re.compile(r"retry[ _-]?after\D{0,3}(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+def throttle_info(exc: BaseException) -> Tuple[bool, Optional[float]]:
+    """判断发送异常是否为平台限流，返回 (是否限流, 建议等待秒数)
+
+    等待秒数取自异常的 retry_after 属性或错误文本中的 "retry after N"
+    """
+    retry_after = getattr(exc, "retry_after", None)
+    if not isinstance(retry_after, (int, float)) or isinstance(retry_after, bool):
+        retry_after = None
+    text = str(exc)
+    if retry_after is None:
+        match = RETRY_AFTER_PATTERN.search(text)
+        if match:
+            retry_after = float(match.group(1))
+    codes = {getattr(exc, name, None) for name in ("status", "status_code", "code", "retcode")}
+    throttled = (
+        retry_after is not None
+        or bool(codes & THROTTLE_CODES)
+        or bool(THROTTLE_PATTERN.search(text))
+    )
+    return throttled, retry_after
+
+
+class TokenBucket:
+    """带失败退避的令牌桶"""
+
+    def __init__(self, rate: float, burst: float, min_factor: float = 0.125):
+        self.rate = rate
+        self.burst = burst
+        self.min_factor = min_factor
+        self.factor = 1.0  # 当前速率倍数，失败时减半，成功后逐步恢复
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+        self.lock = asyncio.Lock()
+
+    @property
+    def effective_rate(self) -> float:
+        return self.rate * self.factor
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.effective_rate)
+        self.updated = now
+
+    async def acquire(self, cost: float) -> float:
+        """取得发送许可，返回等待的秒数；同一会话按到达顺序排队"""
+        started = time.monotonic()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                # 超过桶容量的大消息只要桶满即可发送，欠下的令牌由之后的消息偿还
+                need = min(cost, self.burst)
+                if self.tokens >= need:
+                    self.tokens -= cost
+                    return time.monotonic() - started
+                await asyncio.sleep((need - self.tokens) / self.effective_rate)
+
+    def report(self, ok: bool, retry_after: Optional[float] = None, max_backoff: float = 60):
+        if ok:
+            self.failures = 0
+            self.factor = min(1.0, self.factor * 1.25)
+            return
+        self.failures += 1
+        self.factor = max(self.min_factor, self.factor / 2)
+        backoff = retry_after if retry_after else min(max_backoff, 2 ** self.failures)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + backoff)
+        self.tokens = min(self.tokens, 0)
+
+
+class SendPacer:
+    """每个会话一个令牌桶，长时间空闲的桶自动回收"""
+
+    def __init__(self, idle_ttl: float = 600, max_backoff: float = 60):
+        """
+        Args:
+            idle_ttl: 会话空闲多久后回收其令牌桶（秒）
+            max_backoff: 连续失败时单次暂停的上限（秒）
+        """
+        self.idle_ttl = idle_ttl
+        self.max_backoff = max_backoff
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._last_sweep = time.monotonic()
+
+    def _bucket(self, platform: str, origin: str) -> TokenBucket:
+        bucket = self._buckets.get(origin)
+        if bucket is None:
+            rate, burst = PLATFORM_LIMITS.get(platform, DEFAULT_LIMIT)
+            bucket = self._buckets[origin] = TokenBucket(rate, burst)
+        return bucket
+
+    async def acquire(self, platform: str, origin: str, cost: float = 1.0):
+        self._sweep()
+        waited = await self._bucket(platform, origin).acquire(cost)
+        metrics.observe("pacer.wait_ms", waited * 1000)
+
+    def report(self, platform: str, origin: str, ok: bool, retry_after: Optional[float] = None):
+        bucket = self._bucket(platform, origin)
+        bucket.report(ok, retry_after, self.max_backoff)
+        if not ok:
+            metrics.incr("pacer.backoff")
+            logger.warning(
+                f"[pacer] {origin} 发送失败，速率降至 {bucket.effective_rate:.2f}/s，"
+                f"暂停 {max(0.0, bucket.blocked_until - time.monotonic()):.1f}s"
+            )
+
+    def stats(self) -> Dict[str, float]:
+        throttled = sum(1 for b in self._buckets.values() if b.factor < 1.0)
+        return {"chats": len(self._buckets), "throttled": throttled}
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for origin, bucket in list(self._buckets.items()):
+            idle = now - bucket.updated > self.idle_ttl
+            if idle and not bucket.lock.locked() and bucket.factor >= 1.0:
+                del self._buckets[origin]
@@ -0,0 +1,137 @@
+"""
+按会话排队的发送队列
+同一会话（unified_msg_origin）的帖子严格按到达顺序整条发送，不会与另一条帖子的图片交错；
+不同会话共享一组 worker 并行推进，某个群的长视频不会阻塞其他群
+"""
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class SendQueue:
+    """每个会话一个 FIFO，会话之间轮转调度到共享 worker 池"""
+
+    def __init__(self, workers: int = 4):
+        """
+        Args:
+            workers: 同时处理的会话数上限
+        """
+        self.workers = max(1, workers)
+        # {origin: deque[(job, future, 入队时间)]}
+        self._queues: Dict[str, Deque[Tuple[Job, asyncio.Future, float]]] = {}
+        # 有待处理任务、且当前没有 worker 在处理的会话
+        self._ready: Optional[asyncio.Queue] = None
+        # 已调度（在 _ready 中或正在处理）的会话
+        self._scheduled: Set[str] = set()
+        self._worker_tasks: List[asyncio.Task] = []
+        self._busy = 0
+
+    async def submit(self, origin: str, job: Job) -> Any:
+        """把 job 排入 origin 的队列并等待其执行完成
+
+        等待期间被取消时，未开始的 job 不再执行，已开始的 job 会被取消
+        """
+        self._ensure_workers()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._queues.setdefault(origin, deque())
+        queue.append((job, future, loop.time()))
+        metrics.observe("send_queue.depth", len(queue))
+        if origin not in self._scheduled:
+            self._scheduled.add(origin)
+            self._ready.put_nowait(origin)
+        return await future
+
+    def stats(self) -> Dict[str, int]:
+        depths = [len(q) for q in self._queues.values()]
+        return {
+            "chats": len(depths),
+            "pending": sum(depths),
+            "max_depth": max(depths, default=0),
+            "busy": self._busy,
+            "workers": self.workers,
+        }
+
+    async def close(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
+        for queue in self._queues.values():
+            for _, future, _ in queue:
+                if not future.done():
+                    future.cancel()
+        self._queues.clear()
+        self._scheduled.clear()
+        self._ready = None
+
+    def _ensure_workers(self):
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+        if not self._worker_tasks:
+            self._worker_tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            origin = await self._ready.get()
+            queue = self._queues.get(origin)
+            if queue:
+                job, future, enqueued_at = queue.popleft()
+                if not future.done():
+                    metrics.observe("send_queue.wait_ms", (loop.time() - enqueued_at) * 1000)
+                    self._busy += 1
+                    try:
+                        await self._run(job, future)
+                    finally:
+                        self._busy -= 1
+
+            # 每次只处理一个 job 后重新排到队尾，会话之间轮转
+            queue = self._queues.get(origin)
+            if queue:
+                self._ready.put_nowait(origin)
+            else:
+                self._queues.pop(origin, None)
+                self._scheduled.discard(origin)
+
+    @staticmethod
+    async def _run(job: Job, future: asyncio.Future):
+        task = asyncio.ensure_future(job())
+        by_submitter = False
+
+        def on_done(f: asyncio.Future):
+            # 提交方取消等待时连带取消正在执行的 job
+            nonlocal by_submitter
+            if f.cancelled():
+                by_submitter = True
+                task.cancel()
+
+        future.add_done_callback(on_done)
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if by_submitter:
+                return
+            # worker 自身被取消（插件卸载）
+            if not future.done():
+                future.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"[send_queue] 发送任务异常: {e}")
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
@@ -0,0 +1,128 @@
+"""
+跨实例下载租约
+多个 bot 实例在同一批群里同时收到热门视频时，只让拿到租约的实例下载并发布到共享媒体缓存，
+其他实例等待发布结果；租约由持有者定期续期，持有者崩溃后租约自然过期，
+等待方超时或发现租约失效时自行下载
+"""
+import uuid
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+    from .state_backend import StateBackend, StateBackendError
+except ImportError:
+    from metrics import metrics
+    from state_backend import StateBackend, StateBackendError
+
+
+class Lease:
+    """已持有的租约，持有期间后台续期，用完必须 release"""
+
+    def __init__(self, manager: "LeaseManager", key: str, token: str):
+        self.manager = manager
+        self.key = key
+        self.token = token
+        self.lost = False
+        self._renew_task = asyncio.create_task(self._renew_loop())
+
+    async def _renew_loop(self):
+        backend = self.manager.backend
+        while True:
+            await asyncio.sleep(self.manager.renew_interval)
+            try:
+                if not await backend.compare_and_expire(self.key, self.token, self.manager.ttl):
+                    self.lost = True
+                    logger.warning(f"[lease] 租约已失效: {self.key}")
+                    return
+            except StateBackendError as e:
+                logger.warning(f"[lease] 续期失败: {self.key}, {e}")
+
+    async def release(self):
+        self._renew_task.cancel()
+        try:
+            await self.manager.backend.compare_and_delete(self.key, self.token)
+        except StateBackendError as e:
+            logger.warning(f"[lease] 释放失败（将自然过期）: {self.key}, {e}")
+
+
+class LeaseManager:
+    """基于共享状态后端（SET NX + 比较续期）的租约"""
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        ttl: float = 30,
+        renew_interval: float = 10,
+        poll_interval: float = 1.0,
+    ):
+        """
+        Args:
+            backend: 共享状态后端（sqlite 文件或 Redis 协议服务）
+            ttl: 租约有效期（秒），持有者停止续期后最多这么久被他人接管
+            renew_interval: 续期间隔（秒）
+            poll_interval: 等待方检查结果/租约状态的间隔（秒）
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.poll_interval = poll_interval
+
+    async def try_acquire(self, key: str) -> Optional[Lease]:
+        token = uuid.uuid4().hex
+        lease_key = f"lease:{key}"
+        if await self.backend.set_nx(lease_key, token, ttl=self.ttl):
+            metrics.incr("lease.acquired")
+            return Lease(self, lease_key, token)
+        return None
+
+    async def run_once(
+        self,
+        key: str,
+        produce: Callable[[], Awaitable[bool]],
+        consume: Callable[[], Awaitable[bool]],
+        timeout: float,
+    ) -> bool:
+        """集群内对同一 key 只执行一次 produce
+
+        拿到租约时执行 produce（下载并发布）；否则轮询 consume（读取已发布的结果），
+        租约消失但仍没有结果（持有者失败或崩溃）时重新争抢，等待超过 timeout 后自行执行 produce。
+        后端不可用时直接执行 produce
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        waited = False
+        while True:
+            try:
+                lease = await self.try_acquire(key)
+            except StateBackendError as e:
+                logger.warning(f"[lease] 共享后端不可用，直接下载: {e}")
+                return await produce()
+
+            if lease is not None:
+                try:
+                    # 抢到租约前其他实例可能刚好发布完成
+                    if waited and await consume():
+                        return True
+                    return await produce()
+                finally:
+                    await lease.release()
+
+            waited = True
+            metrics.incr("lease.wait")
+            while loop.time() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                if await consume():
+                    metrics.incr("lease.shared")
+                    return True
+                try:
+                    if await self.backend.get(f"lease:{key}") is None:
+                        break
+                except StateBackendError:
+                    break
+            else:
+                metrics.incr("lease.timeout")
+                logger.warning(f"[lease] 等待其他实例下载超时，自行下载: {key}")
+                return await produce()
@@ -0,0 +1,50 @@
+"""
+同一内容的并发解析合并（singleflight）
+第一个请求执行实际的解析流程，之后到达的同 key 请求直接等待它的结果；
+流程结束后立即移除登记，失败结果会传给所有等待者，但不会影响之后的新请求
+"""
+import copy
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+class SingleFlight:
+    """按 key 合并进行中的异步调用"""
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 fn，或等待已在进行中的同 key 调用
+
+        实际调用放在独立任务中执行，某个请求被取消不会连带取消其他等待者；
+        等待者拿到的是结果的深拷贝，互不影响。fn 依赖的资源（如发起者的 session）
+        在发起者返回后仍可能被使用，调用方需保证它们在任务结束前不被关闭
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            metrics.incr(f"{self.name}.shared")
+            result = await asyncio.shield(task)
+            return copy.deepcopy(result)
+
+        metrics.incr(f"{self.name}.leader")
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 标记异常已读取，避免无人等待时输出 “exception was never retrieved”
+        if not task.cancelled():
+            task.exception()
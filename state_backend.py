@@ -0,0 +1,525 @@
+"""
+跨进程 / 跨节点共享状态后端
+多个 AstrBot 实例加入同一批群时，防抖窗口和解析结果需要在实例间共享，
+否则每个实例都会重复解析同一条链接。接口只包含带过期时间的字符串键值操作：
+    - SqliteBackend: 本机多进程共享一个 sqlite 文件
+    - RedisBackend: 通过 Redis 协议（RESP）访问网络键值服务，适用于多台机器
+"""
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import List, Optional, Union
+from urllib.parse import urlparse, unquote
+
+from astrbot.api import logger
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from metrics import metrics
+
+
+class StateBackendError(Exception):
+    """共享状态后端访问失败"""
+
+
+class StateBackend:
+    """共享状态后端接口，值为字符串，ttl 单位为秒（None 表示不过期）"""
+
+    name = "base"
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def set_nx(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """键不存在时写入，返回是否写入成功（原子操作）"""
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def compare_and_expire(self, key: str, value: str, ttl: float) -> bool:
+        """键的当前值等于 value 时重设过期时间，返回是否成功（用于续租）"""
+        raise NotImplementedError
+
+    async def compare_and_delete(self, key: str, value: str) -> bool:
+        """键的当前值等于 value 时删除，返回是否成功（用于释放租约）"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class SqliteBackend(StateBackend):
+    """基于 sqlite 文件的共享状态，同一台机器上的多个进程可共用"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        """
+        Args:
+            path: sqlite 文件路径
+            busy_timeout: 其他进程持有写锁时的等待时间（秒）
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._db.commit()
+        self._ops = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        await self._run(self._set, key, value, ttl)
+
+    async def set_nx(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return await self._run(self._set_nx, key, value, ttl)
+
+    async def delete(self, key: str):
+        await self._run(self._delete, key)
+
+    async def compare_and_expire(self, key: str, value: str, ttl: float) -> bool:
+        return await self._run(self._compare_and_expire, key, value, ttl)
+
+    async def compare_and_delete(self, key: str, value: str) -> bool:
+        return await self._run(self._compare_and_delete, key, value)
+
+    async def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    async def _run(self, fn, *args):
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except sqlite3.Error as e:
+            raise StateBackendError(f"sqlite 后端访问失败: {e}") from e
+
+    @staticmethod
+    def _expires_at(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl else None
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM kv WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return row[0]
+
+    def _set(self, key: str, value: str, ttl: Optional[float]):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, self._expires_at(ttl)),
+            )
+            self._db.commit()
+            self._maybe_purge()
+
+    def _set_nx(self, key: str, value: str, ttl: Optional[float]) -> bool:
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE 取得写锁，“删除过期 + 插入” 对其他进程是原子的
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                    (key, now),
+                )
+                cur = self._db.execute(
+                    "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, self._expires_at(ttl)),
+                )
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+            self._maybe_purge()
+            return cur.rowcount == 1
+
+    def _delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM kv WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _compare_and_expire(self, key: str, value: str, ttl: float) -> bool:
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE kv SET expires_at = ? WHERE key = ? AND value = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (self._expires_at(ttl), key, value, time.time()),
+            )
+            self._db.commit()
+            return cur.rowcount == 1
+
+    def _compare_and_delete(self, key: str, value: str) -> bool:
+        with self._lock:
+            cur = self._db.execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, value))
+            self._db.commit()
+            return cur.rowcount == 1
+
+    def _maybe_purge(self):
+        """每 200 次写入清理一次过期行（调用方已持有锁）"""
+        self._ops += 1
+        if self._ops % 200:
+            return
+        self._db.execute(
+            "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (time.time(),),
+        )
+        self._db.commit()
+
+
+RespReply = Union[None, int, bytes, List["RespReply"]]
+
+# 比较后续期 / 删除需要原子执行，用服务端脚本实现
+_CAS_EXPIRE_SCRIPT = (
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then "
+    "return redis.call('PEXPIRE', KEYS[1], ARGV[2]) else return 0 end"
+)
+_CAS_DELETE_SCRIPT = (
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then "
+    "return redis.call('DEL', KEYS[1]) else return 0 end"
+)
+
+
+def encode_command(args) -> bytes:
+    """按 RESP 数组格式编码一条命令"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg.encode("utf-8") if isinstance(arg, str) else bytes(arg)
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+
+class RedisBackend(StateBackend):
+    """Redis 协议（RESP2）键值后端，单连接串行请求，断线自动重连"""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "media_parser:", timeout: float = 3.0):
+        """
+        Args:
+            url: redis://[:password@]host[:port][/db]
+            prefix: 所有键的前缀，避免与同一实例上的其他数据冲突
+            timeout: 单条命令超时（秒）
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        path = parsed.path.strip("/")
+        self.db = int(path) if path.isdigit() else 0
+        self.prefix = prefix
+        self.timeout = timeout
+
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, key: str) -> Optional[str]:
+        reply = await self.execute("GET", self.prefix + key)
+        return reply.decode("utf-8") if reply is not None else None
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        args = ["SET", self.prefix + key, value]
+        if ttl:
+            args += ["PX", str(max(1, int(ttl * 1000)))]
+        await self.execute(*args)
+
+    async def set_nx(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        args = ["SET", self.prefix + key, value, "NX"]
+        if ttl:
+            args += ["PX", str(max(1, int(ttl * 1000)))]
+        return await self.execute(*args) is not None
+
+    async def delete(self, key: str):
+        await self.execute("DEL", self.prefix + key)
+
+    async def compare_and_expire(self, key: str, value: str, ttl: float) -> bool:
+        reply = await self.execute(
+            "EVAL", _CAS_EXPIRE_SCRIPT, "1", self.prefix + key, value, str(max(1, int(ttl * 1000)))
+        )
+        return reply == 1
+
+    async def compare_and_delete(self, key: str, value: str) -> bool:
+        reply = await self.execute("EVAL", _CAS_DELETE_SCRIPT, "1", self.prefix + key, value)
+        return reply == 1
+
+    async def execute(self, *args: str) -> RespReply:
+        """发送一条命令并读取回复；连接异常时重连重试一次"""
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await asyncio.wait_for(self._command(args), self.timeout)
+                except StateBackendError:
+                    raise
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    await self._disconnect()
+                    metrics.incr("state_backend.reconnect")
+                    if attempt:
+                        raise StateBackendError(f"redis 后端访问失败: {e}") from e
+                except BaseException:
+                    # 命令发出后被取消：回复还留在连接上，继续使用会让下一条命令读到它，直接丢弃连接
+                    self._abort()
+                    raise
+
+    async def close(self):
+        async with self._lock:
+            await self._disconnect()
+
+    async def _connect(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        # 握手（AUTH/SELECT）成功后才启用连接，失败时关闭，避免之后的命令复用未认证的连接
+        try:
+            if self.password:
+                auth = ["AUTH", self.username, self.password] if self.username else ["AUTH", self.password]
+                await asyncio.wait_for(self._roundtrip(reader, writer, auth), self.timeout)
+            if self.db:
+                await asyncio.wait_for(
+                    self._roundtrip(reader, writer, ["SELECT", str(self.db)]), self.timeout
+                )
+        except BaseException:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            raise
+        self._reader, self._writer = reader, writer
+        logger.info(f"[state_backend] 已连接 redis {self.host}:{self.port}/{self.db}")
+
+    def _abort(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+
+    async def _disconnect(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _command(self, args) -> RespReply:
+        return await self._roundtrip(self._reader, self._writer, args)
+
+    @classmethod
+    async def _roundtrip(
+        cls, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, args
+    ) -> RespReply:
+        writer.write(encode_command(args))
+        await writer.drain()
+        return await cls._read_reply(reader)
+
+    @classmethod
+    async def _read_reply(cls, reader: asyncio.StreamReader) -> RespReply:
+        line = await reader.readuntil(b"\r\n")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise StateBackendError(f"redis 返回错误: {payload.decode('utf-8', 'replace')}")
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            if count < 0:
+                return None
+            return [await cls._read_reply(reader) for _ in range(count)]
+        raise StateBackendError(f"无法识别的 redis 回复: {line!r}")
+
+
+def create_backend(spec: str, data_dir: str) -> Optional[StateBackend]:
+    """按配置创建共享状态后端
+
+    Args:
+        spec: 空字符串（仅本进程内存）、"sqlite"、"sqlite:///绝对路径" 或 "redis://..."
+        data_dir: 插件数据目录，"sqlite" 时在其中创建 shared_state.sqlite3
+    """
+    spec = (spec or "").strip()
+    if not spec:
+        return None
+    try:
+        if spec == "sqlite":
+            return SqliteBackend(os.path.join(data_dir, "shared_state.sqlite3"))
+        if spec.startswith("sqlite://"):
+            return SqliteBackend(urlparse(spec).path or os.path.join(data_dir, "shared_state.sqlite3"))
+        if spec.startswith("redis://"):
+            return RedisBackend(spec)
+    except Exception as e:
+        logger.error(f"[state_backend] 创建共享状态后端失败，使用本地状态: {e}")
+        return None
+    logger.error(f"[state_backend] 无法识别的后端配置: {spec}，使用本地状态")
+    return None
+
+
+# ========== 调试用的自检函数 ==========
+class _FakeRespServer:
+    """本地替身服务：只实现 RedisBackend 用到的命令（AUTH/SELECT/GET/SET/DEL/EVAL）"""
+
+    def __init__(self, password: Optional[str] = None):
+        self.password = password
+        self.data = {}  # {key: (value, 过期时间)}
+        self.connections = 0
+        self.delays = {}  # {key: 秒}，GET 这些键时延迟回复
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry[0] if entry else None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        authed = self.password is None
+        try:
+            while True:
+                args = await RedisBackend._read_reply(reader)
+                command = args[0].decode().upper()
+                if command == "AUTH":
+                    authed = args[-1].decode() == self.password
+                    reply = b"+OK\r\n" if authed else b"-WRONGPASS invalid password\r\n"
+                elif not authed:
+                    reply = b"-NOAUTH Authentication required.\r\n"
+                else:
+                    if command == "GET" and args[1] in self.delays:
+                        await asyncio.sleep(self.delays[args[1]])
+                    reply = self._execute(command, args[1:])
+                writer.write(reply)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _execute(self, command: str, args: List[bytes]) -> bytes:
+        if command == "SELECT":
+            return b"+OK\r\n"
+        if command == "GET":
+            value = self._get(args[0])
+            return b"$-1\r\n" if value is None else encode_command([value])[4:]
+        if command == "SET":
+            options = [a.decode().upper() for a in args[2:]]
+            if "NX" in options and self._get(args[0]) is not None:
+                return b"$-1\r\n"
+            expires = None
+            if "PX" in options:
+                expires = time.monotonic() + int(args[2 + options.index("PX") + 1]) / 1000
+            self.data[args[0]] = (args[1], expires)
+            return b"+OK\r\n"
+        if command == "DEL":
+            return b":%d\r\n" % (self.data.pop(args[0], None) is not None)
+        if command == "EVAL":
+            script, key, value = args[0].decode(), args[2], args[3]
+            if self._get(key) != value:
+                return b":0\r\n"
+            if script == _CAS_EXPIRE_SCRIPT:
+                self.data[key] = (value, time.monotonic() + int(args[4]) / 1000)
+            else:
+                del self.data[key]
+            return b":1\r\n"
+        return b"-ERR unknown command\r\n"
+
+
+async def check_redis_backend() -> int:
+    """对本地替身服务执行 RedisBackend 的各项操作，返回失败条数"""
+    server = _FakeRespServer(password="secret")
+    port = await server.start()
+    results = []
+
+    def expect(name: str, ok: bool):
+        results.append(ok)
+        if not ok:
+            print(f"FAIL {name}")
+
+    try:
+        wrong = RedisBackend(f"redis://:wrong@127.0.0.1:{port}/1", timeout=1)
+        try:
+            await wrong.get("k")
+            expect("wrong password rejected", False)
+        except StateBackendError:
+            expect("wrong password rejected", True)
+        expect("failed handshake not kept", wrong._writer is None)
+        await wrong.close()
+
+        backend = RedisBackend(f"redis://:secret@127.0.0.1:{port}/1", timeout=1)
+        await backend.set("k", "值")
+        expect("set/get unicode", await backend.get("k") == "值")
+        expect("get missing", await backend.get("missing") is None)
+        expect("set_nx first", await backend.set_nx("nx", "a", ttl=0.2))
+        expect("set_nx taken", not await backend.set_nx("nx", "b", ttl=0.2))
+        expect("compare_and_expire match", await backend.compare_and_expire("nx", "a", 0.2))
+        expect("compare_and_expire mismatch", not await backend.compare_and_expire("nx", "b", 10))
+        await asyncio.sleep(0.3)
+        expect("ttl expiry", await backend.get("nx") is None)
+        await backend.set("lease", "token")
+        expect("compare_and_delete mismatch", not await backend.compare_and_delete("lease", "other"))
+        expect("compare_and_delete match", await backend.compare_and_delete("lease", "token"))
+        await backend.delete("k")
+        expect("delete", await backend.get("k") is None)
+
+        # 等待回复时被取消：迟到的回复不能被下一条命令读到
+        await backend.set("slow", "SLOWVALUE")
+        await backend.set("a", "A")
+        server.delays[b"media_parser:slow"] = 0.2
+        slow = asyncio.ensure_future(backend.get("slow"))
+        await asyncio.sleep(0.05)
+        slow.cancel()
+        await asyncio.gather(slow, return_exceptions=True)
+        expect("cancelled reply not reused", await backend.get("a") == "A")
+        await asyncio.sleep(0.2)
+        expect("after cancellation", await backend.get("a") == "A")
+
+        # 服务端断开连接后自动重连
+        backend._writer.close()
+        await backend.set("k2", "v")
+        expect("reconnect", await backend.get("k2") == "v" and server.connections >= 3)
+        await backend.close()
+    finally:
+        await server.stop()
+
+    print(f"{sum(results)}/{len(results)} passed")
+    return len(results) - sum(results)
+
+
+if __name__ == "__main__":
+    raise SystemExit(1 if asyncio.run(check_redis_backend()) else 0)
@@ -0,0 +1,379 @@
+"""
+抖音 ttwid/msToken 身份池
+进程内维护 N 个预热好的独立身份（各自的 CookieJar/msToken/ttwid），
+后台在过期前刷新、隔离失效身份并补位，持久化到本地文件，
+让每次解析不再重复请求 ttwid 注册接口
+"""
+import os
+import re
+import json
+import time
+import random
+import string
+import asyncio
+from http.cookies import SimpleCookie
+from typing import Optional, Dict, List
+
+import aiohttp
+from aiohttp import CookieJar
+from yarl import URL
+from astrbot.api import logger
+
+try:
+    from .dysk import USERAGENT
+    from .http_pool import HttpPool
+except ImportError:
+    from dysk import USERAGENT
+    from http_pool import HttpPool
+
+
+TTWID_REGISTER_PAYLOAD = {
+    "region": "cn",
+    "aid": 1768,
+    "needFid": False,
+    "service": "www.ixigua.com",
+    "migrate_info": {"ticket": "", "source": "node"},
+    "cbUrlProtocol": "https",
+    "union": True
+}
+
+
+def generate_ms_token(length: int = 156) -> str:
+    """生成随机 msToken"""
+    base_str = string.digits + string.ascii_letters
+    return "".join(random.choice(base_str) for _ in range(length))
+
+
+class DouyinIdentity:
+    """一组 msToken + ttwid 身份（持有独立的 CookieJar）"""
+
+    def __init__(
+        self,
+        ms_token: str,
+        ttwid: str = "",
+        created_at: Optional[float] = None,
+        expires_at: Optional[float] = None,
+    ):
+        self.ms_token = ms_token
+        self.ttwid = ttwid
+        self.created_at = created_at or time.time()
+        self.expires_at = expires_at or self.created_at
+
+        # 该身份专属的 CookieJar，重定向等拿到的 cookies 也沉淀在这里
+        self.cookie_jar = CookieJar(unsafe=True)
+        if ttwid:
+            # 直连模式依赖 CookieJar 携带 ttwid，作用域设为整个 douyin.com
+            cookie = SimpleCookie()
+            cookie["ttwid"] = ttwid
+            cookie["ttwid"]["domain"] = ".douyin.com"
+            cookie["ttwid"]["path"] = "/"
+            self.cookie_jar.update_cookies(cookie, URL("https://www.douyin.com/"))
+
+        # 租用与健康状态
+        self.in_use = 0
+        self.failures = 0
+        self.quarantined = False
+
+    @property
+    def ttl(self) -> float:
+        """剩余有效秒数"""
+        return self.expires_at - time.time()
+
+    @property
+    def expired(self) -> bool:
+        return self.ttl <= 0
+
+    def cookies(self) -> Dict[str, str]:
+        """需要手动携带的 cookies"""
+        cookies = {"msToken": self.ms_token}
+        if self.ttwid:
+            cookies["ttwid"] = self.ttwid
+        return cookies
+
+    def to_dict(self) -> dict:
+        return {
+            "ms_token": self.ms_token,
+            "ttwid": self.ttwid,
+            "created_at": self.created_at,
+            "expires_at": self.expires_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Optional["DouyinIdentity"]:
+        if not isinstance(data, dict) or not data.get("ms_token"):
+            return None
+        try:
+            return cls(
+                ms_token=str(data["ms_token"]),
+                ttwid=str(data.get("ttwid") or ""),
+                created_at=float(data.get("created_at") or 0) or None,
+                expires_at=float(data.get("expires_at") or 0) or None,
+            )
+        except (TypeError, ValueError):
+            return None
+
+
+class DouyinTokenStore:
+    """进程级抖音身份池（租用 + 后台刷新 + 失效隔离 + 持久化）"""
+
+    def __init__(
+        self,
+        enable_cf_proxy=False,
+        cf_proxy_url="",
+        size=1,
+        ttl=6 * 3600,
+        refresh_ahead=600,
+        retry_ttl=60,
+        failure_threshold=3,
+        warm_interval=2,
+        timeout=15,
+        persist_path: Optional[str] = None,
+        http_pool: Optional[HttpPool] = None,
+    ):
+        """
+        Args:
+            size: 池中身份数量
+            ttl: 身份最长使用时间（秒），ttwid 自带的过期时间更短时以其为准
+            refresh_ahead: 距离过期多少秒时开始后台刷新
+            retry_ttl: ttwid 获取失败时的临时身份有效期（秒），到期后重试
+            failure_threshold: 连续失败多少次后隔离该身份并重新预热
+            warm_interval: 后台连续预热之间的间隔（秒），避免集中请求注册接口
+            persist_path: 持久化文件路径，为空则不持久化
+            http_pool: 共享连接池，为空时每次预热使用独立 session
+        """
+        self.enable_cf_proxy = enable_cf_proxy
+        self.cf_proxy_url = cf_proxy_url.rstrip("/") if cf_proxy_url else ""
+        self.size = max(1, int(size))
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.retry_ttl = retry_ttl
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.warm_interval = warm_interval
+        self.timeout = timeout
+        self.persist_path = persist_path
+        self.http_pool = http_pool
+
+        self._identities: List[DouyinIdentity] = self._load()[:self.size]
+        self._cursor = 0
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def acquire(self) -> DouyinIdentity:
+        """租用一个身份；池为空时同步预热一个，其余由后台任务补足"""
+        self._ensure_refresher()
+        identity = self._pick()
+        if identity is None:
+            async with self._lock:
+                identity = self._pick()
+                if identity is None:
+                    identity = await self._warm()
+                    self._add(identity)
+        identity.in_use += 1
+        return identity
+
+    def release(self, identity: Optional[DouyinIdentity]):
+        """归还身份"""
+        if identity is not None and identity.in_use > 0:
+            identity.in_use -= 1
+
+    def report(self, identity: Optional[DouyinIdentity], ok: bool):
+        """上报请求结果；连续失败达到阈值的身份被隔离并由后台补位"""
+        if identity is None:
+            return
+        if ok:
+            identity.failures = 0
+            return
+        identity.failures += 1
+        if identity.failures >= self.failure_threshold and not identity.quarantined:
+            identity.quarantined = True
+            if identity in self._identities:
+                self._identities.remove(identity)
+                self._save()
+            logger.warning(
+                f"[token] 身份连续失败 {identity.failures} 次，已隔离并重新预热 "
+                f"(msToken={identity.ms_token[:12]}...)"
+            )
+            self._wakeup.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": self.size,
+            "ready": len([i for i in self._identities if not i.expired]),
+            "in_use": sum(i.in_use for i in self._identities),
+        }
+
+    async def close(self):
+        """停止后台刷新"""
+        self._closed = True
+        if self._refresh_task and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._refresh_task = None
+
+    def _pick(self) -> Optional[DouyinIdentity]:
+        """选出占用最少的健康身份，占用相同时轮询"""
+        healthy = [i for i in self._identities if not i.quarantined and not i.expired]
+        if not healthy:
+            return None
+        start = self._cursor % len(healthy)
+        self._cursor += 1
+        ordered = healthy[start:] + healthy[:start]
+        return min(ordered, key=lambda i: i.in_use)
+
+    def _add(self, identity: DouyinIdentity):
+        if len(self._identities) < self.size:
+            self._identities.append(identity)
+            self._save()
+
+    def _replace(self, old: DouyinIdentity, new: DouyinIdentity):
+        if old in self._identities:
+            self._identities[self._identities.index(old)] = new
+            self._save()
+        else:
+            self._add(new)
+
+    def _ensure_refresher(self):
+        if self._closed:
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        """维护身份池：刷新临近过期的身份，补足被隔离或缺失的位置"""
+        while not self._closed:
+            try:
+                await self._maintain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[token] 后台刷新失败: {e}")
+                await asyncio.sleep(self.retry_ttl)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_delay())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _maintain(self):
+        for identity in list(self._identities):
+            if self._closed:
+                return
+            if self._refresh_delay(identity) > 0:
+                continue
+            async with self._lock:
+                self._replace(identity, await self._warm())
+            await asyncio.sleep(self.warm_interval)
+
+        while len(self._identities) < self.size and not self._closed:
+            async with self._lock:
+                self._add(await self._warm())
+            await asyncio.sleep(self.warm_interval)
+
+    def _next_delay(self) -> float:
+        if len(self._identities) < self.size:
+            return 1
+        delays = [self._refresh_delay(i) for i in self._identities]
+        return max(1, min(delays)) if delays else 1
+
+    def _refresh_delay(self, identity: DouyinIdentity) -> float:
+        """距离下次刷新的秒数；有效期很短的临时身份到期再刷新"""
+        lifetime = identity.expires_at - identity.created_at
+        return identity.ttl - min(self.refresh_ahead, lifetime / 2)
+
+    async def _warm(self) -> DouyinIdentity:
+        """生成 msToken 并向注册接口申请 ttwid"""
+        logger.info("正在预热身份 (获取 ttwid/msToken)...")
+        now = time.time()
+        ms_token = generate_ms_token()
+
+        if self.enable_cf_proxy and self.cf_proxy_url:
+            url = f"{self.cf_proxy_url}/ttwid/ttwid/union/register/"
+        else:
+            url = "https://ttwid.bytedance.com/ttwid/union/register/"
+
+        ttwid = ""
+        max_age = None
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            if self.http_pool is not None:
+                session = self.http_pool.session(timeout=timeout)
+            else:
+                session = aiohttp.ClientSession(timeout=timeout)
+            async with session:
+                async with session.post(
+                    url,
+                    json=TTWID_REGISTER_PAYLOAD,
+                    headers={"User-Agent": USERAGENT},
+                ) as resp:
+                    if resp.status == 200:
+                        ttwid, max_age = self._parse_ttwid(resp)
+                    else:
+                        logger.warning(f"获取 ttwid 失败: HTTP {resp.status}")
+        except Exception as e:
+            logger.warning(f"获取 ttwid 异常: {e}")
+
+        if not ttwid:
+            # 仅有 msToken 的临时身份，短时间后重试
+            return DouyinIdentity(ms_token, "", now, now + self.retry_ttl)
+
+        ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        logger.info(f"ttwid 预热成功，有效期 {int(ttl)}s")
+        return DouyinIdentity(ms_token, ttwid, now, now + ttl)
+
+    @staticmethod
+    def _parse_ttwid(resp: aiohttp.ClientResponse):
+        """从响应 Set-Cookie 中取出 ttwid 及其 Max-Age"""
+        morsel = resp.cookies.get("ttwid")
+        if morsel is not None and morsel.value:
+            max_age = None
+            if morsel["max-age"]:
+                try:
+                    max_age = int(morsel["max-age"])
+                except ValueError:
+                    pass
+            return morsel.value, max_age
+
+        # CF Worker 可能合并了 Set-Cookie 头，回退到正则提取
+        for header in resp.headers.getall("Set-Cookie", []):
+            match = re.search(r"ttwid=([^;]+)", header)
+            if match:
+                return match.group(1), None
+        return "", None
+
+    def _load(self) -> List[DouyinIdentity]:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return []
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception as e:
+            logger.warning(f"[token] 读取缓存失败: {e}")
+            return []
+        if isinstance(raw, dict):
+            raw = [raw]
+        identities = []
+        for item in raw if isinstance(raw, list) else []:
+            identity = DouyinIdentity.from_dict(item)
+            if identity is not None and not identity.expired:
+                identities.append(identity)
+        if identities:
+            logger.info(f"[token] 已加载 {len(identities)} 个缓存身份")
+        return identities
+
+    def _save(self):
+        if not self.persist_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.persist_path), exist_ok=True)
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([i.to_dict() for i in self._identities], f)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            logger.warning(f"[token] 保存缓存失败: {e}")
@@ -0,0 +1,122 @@
+"""
+抖音链接本地分类
+完整的 douyin.com / iesdouyin.com 链接可以直接读出 aweme_id，无需任何网络请求；
+只有真正的短链接才需要走重定向解析
+"""
+import re
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+
+# 短链接主机（需要网络重定向才能得到 aweme_id）
+DOUYIN_SHORT_HOSTS = {"v.douyin.com", "v.iesdouyin.com"}
+
+# 小红书短链接主机
+XHS_SHORT_HOSTS = {"xhslink.com", "www.xhslink.com"}
+
+# 所有需要重定向解析的短链接主机（短链接缓存按此判断）
+SHORT_LINK_HOSTS = DOUYIN_SHORT_HOSTS | XHS_SHORT_HOSTS
+
+# 完整链接主机
+DOUYIN_LONG_HOSTS = {
+    "douyin.com",
+    "www.douyin.com",
+    "m.douyin.com",
+    "iesdouyin.com",
+    "www.iesdouyin.com",
+    "m.iesdouyin.com",
+}
+
+# 按顺序匹配的 aweme_id 提取规则：(名称, 匹配位置, 正则)
+# 路径规则优先：iesdouyin 分享链接的查询参数里 mid 是音乐 ID
+AWEME_ID_RULES = [
+    ("path", "path", re.compile(r"/(?:share/)?(?:video|note|slides)/(\d+)")),
+    ("modal_id", "query", re.compile(r"(?:^|&)(?:modal_id|aweme_id|item_id)=(\d+)")),
+    ("mid", "query", re.compile(r"(?:^|&)mid=(\d+)")),
+    ("fragment", "fragment", re.compile(r"(?:modal_id|aweme_id)=(\d+)")),
+]
+
+# 已知链接形态及期望结果：(链接, 分类, aweme_id)
+URL_SHAPE_CORPUS = [
+    ("https://www.douyin.com/video/7312345678901234567", "id", "7312345678901234567"),
+    ("https://douyin.com/video/7312345678901234567?previous_page=app_code_link", "id", "7312345678901234567"),
+    ("https://www.douyin.com/note/7312345678901234567", "id", "7312345678901234567"),
+    ("https://www.douyin.com/slides/7312345678901234567", "id", "7312345678901234567"),
+    ("https://www.douyin.com/discover?modal_id=7312345678901234567", "id", "7312345678901234567"),
+    ("https://www.douyin.com/jingxuan?modal_id=7312345678901234567", "id", "7312345678901234567"),
+    ("https://www.douyin.com/user/MS4wLjABAAAA?from_tab_name=main&modal_id=7312345678901234567", "id", "7312345678901234567"),
+    ("https://www.douyin.com/root/search/abc?aid=1&modal_id=7312345678901234567&type=general", "id", "7312345678901234567"),
+    ("https://www.iesdouyin.com/share/video/7312345678901234567/?region=CN&mid=7300000000000000000", "id", "7312345678901234567"),
+    ("https://www.iesdouyin.com/share/note/7312345678901234567/", "id", "7312345678901234567"),
+    ("https://www.iesdouyin.com/share/slides/7312345678901234567/?did=1", "id", "7312345678901234567"),
+    ("https://m.douyin.com/share/video/7312345678901234567", "id", "7312345678901234567"),
+    ("https://www.douyin.com/share/video/7312345678901234567", "id", "7312345678901234567"),
+    ("https://www.douyin.com/#/?aweme_id=7312345678901234567", "id", "7312345678901234567"),
+    ("https://v.douyin.com/iRNBho6u/", "short", None),
+    ("https://v.douyin.com/AbC-d_E/", "short", None),
+    ("https://www.douyin.com/user/MS4wLjABAAAA", "unsupported", None),
+    ("https://www.douyin.com/", "unsupported", None),
+    ("https://www.example.com/video/7312345678901234567", "unknown", None),
+    ("not a url", "unknown", None),
+]
+
+
+def extract_aweme_id(url: str) -> Optional[str]:
+    """按规则表从链接中读出 aweme_id（不校验主机）"""
+    try:
+        parsed = urlparse(url.strip())
+    except Exception:
+        return None
+    parts = {"path": parsed.path, "query": parsed.query, "fragment": parsed.fragment}
+    for _, where, pattern in AWEME_ID_RULES:
+        match = pattern.search(parts[where])
+        if match:
+            return match.group(1)
+    return None
+
+
+def classify_douyin_url(url: str) -> Tuple[str, Optional[str]]:
+    """对抖音链接分类
+
+    Returns:
+        (分类, aweme_id)，分类取值：
+        - "id": 完整链接，aweme_id 已直接读出
+        - "short": 短链接，需要网络重定向
+        - "unsupported": 抖音完整链接但不含作品 ID
+        - "unknown": 非抖音链接
+    """
+    if not isinstance(url, str):
+        return "unknown", None
+    try:
+        parsed = urlparse(url.strip())
+    except Exception:
+        return "unknown", None
+    if parsed.scheme not in {"http", "https"}:
+        return "unknown", None
+
+    host = (parsed.hostname or "").lower()
+    if host in DOUYIN_SHORT_HOSTS:
+        return "short", None
+    if host in DOUYIN_LONG_HOSTS:
+        aweme_id = extract_aweme_id(url)
+        if aweme_id:
+            return "id", aweme_id
+        return "unsupported", None
+    return "unknown", None
+
+
+# ========== 调试用的自检函数 ==========
+def check_corpus() -> int:
+    """按 URL_SHAPE_CORPUS 校验分类结果，返回失败条数"""
+    failures = 0
+    for url, expected_kind, expected_id in URL_SHAPE_CORPUS:
+        kind, aweme_id = classify_douyin_url(url)
+        if (kind, aweme_id) != (expected_kind, expected_id):
+            failures += 1
+            print(f"FAIL {url}: got ({kind}, {aweme_id}), expected ({expected_kind}, {expected_id})")
+    print(f"{len(URL_SHAPE_CORPUS) - failures}/{len(URL_SHAPE_CORPUS)} passed")
+    return failures
+
+
+if __name__ == "__main__":
+    raise SystemExit(1 if check_corpus() else 0)